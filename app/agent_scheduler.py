@@ -9,107 +9,344 @@ Think of it like:
 - The scheduler checks: "Is it time yet?"
 - If YES → Turn agent ON
 - If NO → Keep it OFF
+
+Instead of checking on a fixed tick, the scheduler sleeps until either
+an agent changes in MongoDB (change stream) or the next start/end time
+of some agent is reached.
 """
 
 from __future__ import annotations
 
 import asyncio
-from datetime import datetime
-from typing import List, Dict
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Coroutine, Dict, Optional, Set, Tuple
 
-from app.db import get_agents_collection
+from app.db import get_agents_collection_async
+from app.models import AGENT_STATUS_PENDING, AGENT_STATUS_RUNNING, AGENT_STATUS_TERMINATED
 from app.shared_hub.hub import SharedFrameHub
 from app.rule_engine.engine import (
     AgentRuntime,
     build_agent_runtime_from_doc,
+    forget_camera,
     process_frame_for_agent,
 )
 
+logger = logging.getLogger("vision_core.scheduler")
+
 # Track background runner tasks per agent
 _agent_tasks: Dict[str, asyncio.Task] = {}
 
+# Cameras with at least one running agent, refreshed on every reconcile
+# pass. Lets the streamer answer "does anyone need this camera's frames?"
+# from memory instead of asking MongoDB (see running_agents_for_camera).
+_running_cameras: Set[str] = set()
+
+# Built runtimes per agent, tagged with the agent's updated_at. An agent
+# that starts again without being edited reuses its runtime instead of
+# re-fetching its document and re-parsing its rules. Entries of agents
+# that are deleted or terminated are dropped (see _evict_runtimes).
+_runtime_cache: Dict[str, Tuple[Any, AgentRuntime]] = {}
+
+# Live runner tasks per camera. The engine's per-camera caches are
+# dropped when the last one finishes (see _run_agent).
+_camera_runners: Dict[str, int] = {}
+
+# How long a stopping runner may take to finish its current frame
+_STOP_TIMEOUT_SEC = 2.0
+
+# Smoothing of a runner's measured per-frame processing time (EMA weight)
+_PROC_EMA_ALPHA = 0.2
+
+# asyncio only keeps weak references to tasks, so every task we start is
+# kept here until it finishes (otherwise it may be garbage-collected mid-run)
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _spawn(coro: Coroutine) -> asyncio.Task:
+    """Start a background task and hold a strong reference to it."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+# Agents the scheduler looks after: not terminated yet and with both times set
+_SCHEDULED_FILTER = {
+    "status": {"$ne": AGENT_STATUS_TERMINATED},
+    "start_at": {"$ne": None},
+    "end_at": {"$ne": None},
+}
+
+# DECIDE THE NEW STATUS - evaluated by MongoDB itself, so no agent
+# documents have to travel to Python just to compare times:
+# - continuous agents always run regardless of time window
+# - before start_at → pending
+# - between start_at and end_at → running
+# - after end_at → terminated
+_STATUS_PIPELINE = [
+    {
+        "$set": {
+            "status": {
+                "$switch": {
+                    "branches": [
+                        {"case": {"$eq": [{"$toLower": "$run_mode"}, "continuous"]}, "then": AGENT_STATUS_RUNNING},
+                        {"case": {"$lt": ["$$NOW", "$start_at"]}, "then": AGENT_STATUS_PENDING},
+                        {"case": {"$lt": ["$$NOW", "$end_at"]}, "then": AGENT_STATUS_RUNNING},
+                    ],
+                    "default": AGENT_STATUS_TERMINATED,
+                }
+            }
+        }
+    }
+]
+
+
+# The scan only needs these fields; full documents are loaded on demand
+_RUNNING_FILTER = {"status": AGENT_STATUS_RUNNING, "start_at": {"$ne": None}, "end_at": {"$ne": None}}
+_SCAN_PROJECTION = {
+    "_id": 1, "agent_id": 1, "camera_id": 1, "start_at": 1, "end_at": 1, "status": 1, "run_mode": 1,
+    "updated_at": 1,
+}
+
+# Change stream events that may change which agents should run
+_CHANGE_PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}
+]
+
+
+async def _watch_agent_changes(wakeup: asyncio.Event) -> None:
+    """Wake the scheduler whenever an agent is created, changed or removed.
+
+    Change streams need a replica set; on a standalone MongoDB the watch
+    fails and the scheduler falls back to checking every few seconds.
+    """
+    coll = get_agents_collection_async()
+    try:
+        async with coll.watch(_CHANGE_PIPELINE) as stream:
+            logger.info("👀 Watching agents collection for changes")
+            async for _change in stream:
+                wakeup.set()
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        logger.warning("⚠️ Agent change stream unavailable, falling back to polling: %s", exc)
+    finally:
+        # Let the scheduler notice that it no longer gets change events
+        wakeup.set()
+
+
+async def _next_transition_delay(coll, now: datetime) -> Optional[float]:
+    """Seconds until the next start_at/end_at of any scheduled agent.
+
+    Returns None when no agent is waiting for a time-based transition.
+    """
+    upcoming = []
+    pending = await coll.find_one(
+        {"status": AGENT_STATUS_PENDING, "start_at": {"$gt": now}},
+        {"start_at": 1},
+        sort=[("start_at", 1)],
+    )
+    if pending:
+        upcoming.append(pending["start_at"])
+    running = await coll.find_one(
+        {"status": AGENT_STATUS_RUNNING, "end_at": {"$gt": now}},
+        {"end_at": 1},
+        sort=[("end_at", 1)],
+    )
+    if running:
+        upcoming.append(running["end_at"])
+
+    if not upcoming:
+        return None
+    return max(0.0, (min(upcoming) - datetime.now(timezone.utc)).total_seconds())
+
+
+async def _get_runtime(coll, agent_doc: Dict[str, Any]) -> Optional[AgentRuntime]:
+    """Return the AgentRuntime for a scanned agent, building it only if the agent changed."""
+    agent_id = agent_doc["agent_id"]
+    updated_at = agent_doc.get("updated_at")
+    cached = _runtime_cache.get(agent_id)
+    if cached is not None and updated_at is not None and cached[0] == updated_at:
+        return cached[1]
 
-async def _agent_status_loop(interval_seconds: int = 10) -> None:
+    # The runner needs rules, model_ids, fps, ... so load the full document
+    full_doc = await coll.find_one({"_id": agent_doc["_id"]})
+    if full_doc is None:
+        return None
+    # Building may load a YOLO model from disk, keep that off the event loop
+    runtime = await asyncio.to_thread(build_agent_runtime_from_doc, full_doc)
+    if runtime is not None:
+        _runtime_cache[agent_id] = (updated_at, runtime)
+    return runtime
 
-    coll = get_agents_collection()
-    
-    print("⏰ Agent scheduler started (checks every 10 seconds)")
+
+async def _stop_runner(agent_id: str) -> None:
+    """Cancel an agent's runner and wait (bounded) until it has really finished."""
+    task = _agent_tasks.pop(agent_id, None)
+    if task is None:
+        return
+    task.cancel()
+    # asyncio.wait never cancels or raises for the awaited task, so a slow
+    # runner can't stall the scheduler longer than the timeout
+    await asyncio.wait({task}, timeout=_STOP_TIMEOUT_SEC)
+    if not task.done():
+        logger.warning("⚠️ Runner for agent '%s' did not stop within %ss", agent_id, _STOP_TIMEOUT_SEC)
+
+
+async def _evict_runtimes(coll, desired: Dict[str, Dict[str, Any]]) -> None:
+    """Forget the cached runtimes of agents that left the scheduled set."""
+    idle = [agent_id for agent_id in _runtime_cache if agent_id not in desired]
+    if not idle:
+        return
+    # Pending agents will run again, so their runtimes are kept
+    still_scheduled = set(
+        await coll.distinct("agent_id", {**_SCHEDULED_FILTER, "agent_id": {"$in": idle}})
+    )
+    for agent_id in idle:
+        if agent_id not in still_scheduled:
+            _runtime_cache.pop(agent_id, None)
+
+
+async def _reconcile_runners(coll) -> None:
+    """Start/stop per-agent runners so exactly the running agents have one."""
+    # The agents that SHOULD have a runner right now
+    desired: Dict[str, Dict[str, Any]] = {}
+    async for agent_doc in coll.find(_RUNNING_FILTER, _SCAN_PROJECTION):
+        agent_id = agent_doc.get("agent_id")
+        if agent_id:
+            desired[agent_id] = agent_doc
+
+    # Swap in a new set (readers never see a half-built one)
+    global _running_cameras
+    _running_cameras = {doc["camera_id"] for doc in desired.values() if doc.get("camera_id")}
+
+    # Only touch the difference between desired and actual runners:
+    # start the missing ones (their documents/models are loaded concurrently) ...
+    to_start = list(desired.keys() - _agent_tasks.keys())
+    runtimes = await asyncio.gather(
+        *(_get_runtime(coll, desired[agent_id]) for agent_id in to_start),
+        return_exceptions=True,
+    )
+    for agent_id, runtime in zip(to_start, runtimes):
+        if isinstance(runtime, Exception):
+            logger.warning("⚠️ Could not start agent '%s': %s", agent_id, runtime)
+        elif runtime is not None:
+            _agent_tasks[agent_id] = _spawn(_run_agent(runtime))
+
+    # ... and stop the ones that should not run anymore
+    for agent_id in _agent_tasks.keys() - desired.keys():
+        await _stop_runner(agent_id)
+
+    await _evict_runtimes(coll, desired)
+
+
+async def _agent_status_loop(interval_seconds: int = 10, run_agents: bool = True) -> None:
+    coll = get_agents_collection_async()
+    wakeup = asyncio.Event()
+    watcher = _spawn(_watch_agent_changes(wakeup))
+
+    logger.info("⏰ Agent scheduler started (wakes on agent changes and start/end times)")
 
     while True:
-        # Get current time
-        now = datetime.utcnow()
-        
+        wakeup.clear()
+        # One (timezone-aware) reading of the clock per pass
+        now = datetime.now(timezone.utc)
+
         try:
-            # Get ALL agents that are not already terminated
-            agents = coll.find({"status": {"$ne": "terminated"}})
-            
-            for agent_doc in agents:
-                start_at = agent_doc.get("start_at")
-                end_at = agent_doc.get("end_at")
-                current_status = agent_doc.get("status", "pending")
-                agent_id = agent_doc.get("agent_id")
-                run_mode = str(agent_doc.get("run_mode", "scheduled")).lower()
-
-                # Skip if missing times
-                if not start_at or not end_at:
-                    continue
-
-                # DECIDE THE NEW STATUS
-                if run_mode == "continuous":
-                    # Always run regardless of time window
-                    new_status = "running"
-                else:
-                    if now < start_at:
-                        new_status = "pending"
-                    elif start_at <= now < end_at:
-                        new_status = "running"
-                    else:
-                        new_status = "terminated"
-
-                # If status changed, update database
-                if new_status != current_status:
-                    coll.update_one(
-                        {"_id": agent_doc["_id"]},
-                        {"$set": {"status": new_status}}
-                    )
-                    print(f"📊 Agent '{agent_id}': {current_status} → {new_status}")
-
-                # Ensure runner is started/stopped based on effective status
-                effective_status = new_status
-                if effective_status == "running":
-                    if agent_id not in _agent_tasks:
-                        runtime = build_agent_runtime_from_doc(agent_doc)
-                        if runtime is not None:
-                            _agent_tasks[agent_id] = asyncio.create_task(_run_agent(runtime))
-                else:
-                    task = _agent_tasks.pop(agent_id, None)
-                    if task is not None:
-                        task.cancel()
+            # Update the status of ALL scheduled agents in one server-side call
+            result = await coll.update_many(_SCHEDULED_FILTER, _STATUS_PIPELINE)
+            if result.modified_count:
+                logger.info("📊 Agent statuses changed: %d", result.modified_count)
+
+            if run_agents:
+                await _reconcile_runners(coll)
+
+            # Sleep until the next agent has to start or stop
+            delay = await _next_transition_delay(coll, now)
 
         except Exception as exc:
-            print(f"⚠️ Error in scheduler: {exc}")
+            logger.error("⚠️ Error in scheduler: %s", exc)
             # Keep running even if error occurs (auto-recovery)
+            delay = interval_seconds
+
+        # Without a change stream we would never hear about new agents,
+        # so keep checking every interval_seconds in that case
+        if watcher.done():
+            delay = interval_seconds if delay is None else min(delay, interval_seconds)
 
-        # Wait before checking again
-        await asyncio.sleep(interval_seconds)
+        # Wait until something changes or the next transition is due
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
 
 
 async def _run_agent(runtime: AgentRuntime) -> None:
-    """Continuously pull latest frames for the agent's camera and process at the agent's FPS."""
+    """Continuously pull latest frames for the agent's camera and process at the agent's FPS.
+
+    When processing a frame takes longer than the FPS allows, the period
+    grows to the (smoothed) processing time: the agent then runs at the
+    rate it can sustain, always on the newest frame, rather than back to
+    back with no pause for the rest of the event loop.
+    """
     hub = SharedFrameHub.instance()
-    interval = 1.0 / max(1, int(runtime.fps or 1))
+    interval_ns = 1_000_000_000 // max(1, int(runtime.fps or 1))
     channel_out = f"agent:{runtime.agent_id}"
+    last_frame = None
+    proc_ema_ns = 0.0
+    # Pace by deadlines on the monotonic clock, so processing time doesn't
+    # stretch the period (a plain sleep(interval) adds it on top). Integer
+    # nanoseconds keep the deadline exact however long the agent runs.
+    next_at = time.monotonic_ns()
+    _camera_runners[runtime.camera_id] = _camera_runners.get(runtime.camera_id, 0) + 1
     try:
         while True:
-            await asyncio.sleep(interval)
+            next_at += max(interval_ns, int(proc_ema_ns))
+            delay_ns = next_at - time.monotonic_ns()
+            if delay_ns > 0:
+                await asyncio.sleep(delay_ns / 1e9)
+            else:
+                # Fell behind: carry on from now instead of bursting to catch up
+                next_at = time.monotonic_ns()
+                await asyncio.sleep(0)
+
             frame = hub.get_latest(runtime.camera_id)
-            if frame is None:
+            # No new camera frame since last time: skip conversion and detection
+            if frame is None or frame is last_frame:
                 continue
-            processed = process_frame_for_agent(runtime, frame)
-            hub.publish(channel_out, processed)
+            last_frame = frame
+            started = time.monotonic_ns()
+            processed = await process_frame_for_agent(runtime, frame)
+            proc_ema_ns += _PROC_EMA_ALPHA * ((time.monotonic_ns() - started) - proc_ema_ns)
+            if processed is not None:
+                hub.publish(channel_out, processed)
     except asyncio.CancelledError:
         return
+    finally:
+        # Don't keep the last processed frame of a stopped agent around
+        hub.close_channel(channel_out)
+        # ... nor the camera's shared frames once no agent is left on it
+        _camera_runners[runtime.camera_id] -= 1
+        if not _camera_runners[runtime.camera_id]:
+            del _camera_runners[runtime.camera_id]
+            forget_camera(runtime.camera_id)
+
+
+def running_agents_for_camera(camera_id: str) -> bool:
+    """True if an agent is running for ``camera_id`` (as of the last scheduler pass).
+
+    Only maintained where the scheduler runs agents (``run_agents=True``).
+    """
+    return camera_id in _running_cameras
+
 
+async def start_agent_scheduler(run_agents: bool = True) -> None:
+    """Start the scheduler in the background.
 
-async def start_agent_scheduler() -> None:
-    asyncio.create_task(_agent_status_loop())
+    Agent runners need the camera frames in SharedFrameHub, which only
+    exist in the sender process. Other processes (the API) pass
+    ``run_agents=False`` to keep statuses up to date without loading
+    models or running agents that never get a frame.
+    """
+    _spawn(_agent_status_loop(run_agents=run_agents))
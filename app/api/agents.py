@@ -1,26 +1,79 @@
+from collections import OrderedDict
 from datetime import datetime, timezone
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pymongo import ReturnDocument
 
-from app.db import get_agents_collection, get_cameras_collection
+from app.db import get_agents_collection_async, get_cameras_collection_async
 from app.models import AgentCreate, AgentOut
 
 
 router = APIRouter(prefix="/api", tags=["agents"])
 
+# Converted agents keyed by (id, updated_at, status). ``updated_at`` is
+# bumped on every upsert and the scheduler only ever changes ``status``,
+# so an unchanged key means the document is unchanged too.
+_AGENT_OUT_CACHE_SIZE = 4096
+_agent_out_cache: "OrderedDict[Tuple, AgentOut]" = OrderedDict()
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Return ``value`` as an aware UTC datetime (naive values are taken as UTC)."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
 
 def _mongo_agent_to_out(doc: dict) -> AgentOut:
     """Convert a raw MongoDB document into an AgentOut model.
 
     We expose the MongoDB ``_id`` as a simple ``id`` string field.
+    Conversions are memoized so listing the same agents again skips
+    pydantic validation.
     """
     if not doc:
         raise ValueError("Agent document is empty")
+
+    # Documents written before updated_at existed are never cached
+    key = None
+    if doc.get("updated_at") is not None:
+        key = (str(doc["_id"]), doc["updated_at"], doc.get("status"))
+        cached = _agent_out_cache.get(key)
+        if cached is not None:
+            _agent_out_cache.move_to_end(key)
+            return cached
+
     doc = dict(doc)
     doc["id"] = str(doc.pop("_id"))
-    return AgentOut(**doc)
+    out = AgentOut(**doc)
+
+    if key is not None:
+        _agent_out_cache[key] = out
+        if len(_agent_out_cache) > _AGENT_OUT_CACHE_SIZE:
+            _agent_out_cache.popitem(last=False)
+    return out
+
+
+def _encode_agent(out: AgentOut) -> bytes:
+    return orjson.dumps(out.dict(by_alias=True))
+
+
+async def _json_array_stream(first: Optional[AgentOut], docs) -> AsyncIterator[bytes]:
+    """Encode ``first`` and the documents left in ``docs`` as one JSON array.
+
+    Every document goes through AgentOut, so only its fields reach the
+    client, exactly as with ``response_model``.
+    """
+    if first is None:
+        yield b"[]"
+        return
+    yield b"[" + _encode_agent(first)
+    async for doc in docs:
+        yield b"," + _encode_agent(_mongo_agent_to_out(doc))
+    yield b"]"
 
 
 @router.post("/agents", response_model=AgentOut)
@@ -31,23 +84,32 @@ async def upsert_agent(agent: AgentCreate) -> AgentOut:
     If an agent with the same ``agent_id`` already exists, it will be
     replaced; otherwise, a new document is created.
     """
-    coll = get_agents_collection()
+    coll = get_agents_collection_async()
 
     # Ensure the referenced camera exists; this also allows us to
     # validate that the camera_id is known in our system.
-    cameras_coll = get_cameras_collection()
-    camera_doc = cameras_coll.find_one({"camera_id": agent.camera_id})
+    cameras_coll = get_cameras_collection_async()
+    # Only camera_id is projected, so the camera_id index answers this
+    # on its own (covered query, no document fetch)
+    camera_doc = await cameras_coll.find_one(
+        {"camera_id": agent.camera_id},
+        {"_id": 0, "camera_id": 1},
+    )
     if not camera_doc:
         raise HTTPException(status_code=404, detail="Camera not found for given camera_id")
 
     now = datetime.now(timezone.utc)
     payload = agent.dict(by_alias=True)
+    # Store the schedule in UTC so MongoDB and the scheduler compare like with like
+    payload["start_at"] = _as_utc(payload["start_at"])
+    payload["end_at"] = _as_utc(payload["end_at"])
     if not payload.get("created_at"):
         payload["created_at"] = now
+    payload["updated_at"] = now
 
     # Upsert by agent_id so repeated calls for the same agent simply
     # update the existing document.
-    result = coll.find_one_and_update(
+    result = await coll.find_one_and_update(
         {"agent_id": payload["agent_id"]},
         {"$set": payload},
         upsert=True,
@@ -57,24 +119,38 @@ async def upsert_agent(agent: AgentCreate) -> AgentOut:
 
 
 @router.get("/agents", response_model=List[AgentOut])
-async def list_agents(camera_id: Optional[str] = None, status: Optional[str] = None) -> List[AgentOut]:
-    """List agents, optionally filtered by camera_id and/or status."""
-    coll = get_agents_collection()
+async def list_agents(camera_id: Optional[str] = None, status: Optional[str] = None) -> StreamingResponse:
+    """List agents, optionally filtered by camera_id and/or status.
+
+    The JSON array is streamed while the cursor is read, so the whole
+    result never has to sit in memory at once. Each document is still
+    validated as ``AgentOut`` (memoized, see _mongo_agent_to_out); the
+    streamed response bypasses ``response_model``, which is kept for the
+    docs.
+    """
+    coll = get_agents_collection_async()
     query: dict = {}
     if camera_id:
         query["camera_id"] = camera_id
     if status:
         query["status"] = status
 
-    docs = list(coll.find(query))
-    return [_mongo_agent_to_out(d) for d in docs]
+    docs = coll.find(query, batch_size=200).__aiter__()
+    # The first batch is read (and its first agent validated) before the
+    # 200 goes out, so a failing query gets a real error response rather
+    # than a truncated array
+    try:
+        first: Optional[AgentOut] = _mongo_agent_to_out(await docs.__anext__())
+    except StopAsyncIteration:
+        first = None
+    return StreamingResponse(_json_array_stream(first, docs), media_type="application/json")
 
 
 @router.get("/agents/{agent_id}", response_model=AgentOut)
 async def get_agent(agent_id: str) -> AgentOut:
     """Fetch a single agent by its agent_id."""
-    coll = get_agents_collection()
-    doc = coll.find_one({"agent_id": agent_id})
+    coll = get_agents_collection_async()
+    doc = await coll.find_one({"agent_id": agent_id})
     if not doc:
         raise HTTPException(status_code=404, detail="Agent not found")
     return _mongo_agent_to_out(doc)
@@ -1,9 +1,12 @@
-from datetime import datetime
-from typing import List
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List
 
 import os
+import time
 
 from fastapi import APIRouter, HTTPException
+from pymongo import ReturnDocument
 
 from app.db import get_cameras_collection
 from app.models import CameraCreate, CameraOut, WebRTCConfig
@@ -11,6 +14,44 @@ from app.models import CameraCreate, CameraOut, WebRTCConfig
 router = APIRouter(prefix="/api", tags=["cameras"])
 
 
+def _ice_servers_from_env() -> List[Dict[str, Any]]:
+    """Build the ICE server list (STUN + optional TURN) from environment variables."""
+    ice_servers: List[Dict[str, Any]] = [
+        {"urls": "stun:stun.l.google.com:19302"},
+    ]
+
+    aws_turn_ip = os.getenv("AWS_TURN_IP")
+    aws_turn_port = os.getenv("AWS_TURN_PORT")
+    aws_turn_user = os.getenv("AWS_TURN_USER")
+    aws_turn_pass = os.getenv("AWS_TURN_PASS")
+
+    if aws_turn_ip and aws_turn_port and aws_turn_user and aws_turn_pass:
+        ice_servers.append(
+            {
+                "urls": [
+                    f"turn:{aws_turn_ip}:{aws_turn_port}?transport=udp",
+                    f"turn:{aws_turn_ip}:{aws_turn_port}?transport=tcp",
+                ],
+                "username": aws_turn_user,
+                "credential": aws_turn_pass,
+            }
+        )
+    return ice_servers
+
+
+# Environment only changes on restart, so read it once at import time
+_SIGNALING_WS = (os.getenv("SIGNALING_WS") or "").rstrip("/")
+_ICE_SERVERS = _ice_servers_from_env()
+
+# Users known to have at least one camera -> time of the last check,
+# oldest check first. Only positive answers are cached so a freshly added
+# camera is never hidden. Expired entries and those beyond the size bound
+# are dropped from the front whenever a check is recorded.
+_user_has_camera_cache: "OrderedDict[str, float]" = OrderedDict()
+_USER_CAMERA_TTL_SEC = 60.0
+_USER_CAMERA_CACHE_SIZE = 4096
+
+
 @router.post("/cameras", response_model=CameraOut)
 def add_camera(camera: CameraCreate) -> CameraOut:
     """Register or update a camera sent from Samit's backend.
@@ -38,31 +79,35 @@ def add_camera(camera: CameraCreate) -> CameraOut:
         "camera_name": camera.name,
         "rtsp_url": camera.stream_url,
         "device_id": camera.device_id,
-        "created_at": datetime.utcnow(),
     }
 
-    coll.update_one(
+    # Write and read back in a single round-trip. created_at is only set
+    # when the camera is first registered.
+    saved = coll.find_one_and_update(
         {"user_id": doc["user_id"], "camera_id": doc["camera_id"]},
-        {"$set": doc},
+        {"$set": doc, "$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
         upsert=True,
-    )
-
-    saved = coll.find_one(
-        {"user_id": doc["user_id"], "camera_id": doc["camera_id"]},
-        {"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        projection={"_id": 0},
     )
     if not saved:
         raise HTTPException(status_code=500, detail="Failed to save camera")
 
+    _user_has_camera_cache[doc["user_id"]] = time.monotonic()
+
     return CameraOut(**saved)
 
 
 @router.get("/cameras", response_model=List[CameraOut])
 def list_cameras(user_id: str) -> List[CameraOut]:
-    """List all cameras belonging to a specific user."""
+    """List all cameras belonging to a specific user.
+
+    Every document is validated as ``CameraOut`` (like list_agents does
+    with ``AgentOut``), so only its fields reach the client.
+    """
     coll = get_cameras_collection()
     docs = coll.find({"user_id": user_id}, {"_id": 0}).sort("camera_id")
-    return [CameraOut(**d) for d in docs]
+    return [CameraOut(**doc) for doc in docs]
 
 
 @router.get("/webrtc-config", response_model=WebRTCConfig)
@@ -77,36 +122,26 @@ def get_webrtc_config(user_id: str) -> WebRTCConfig:
     and returns the minimal data the browser needs (`iceServers`).
     """
 
-    coll = get_cameras_collection()
-    has_camera = coll.find_one({"user_id": user_id})
-    if not has_camera:
-        raise HTTPException(status_code=404, detail="No cameras found for this user_id in Vision database")
-
-    signaling_ws = os.getenv("SIGNALING_WS")
-    if not signaling_ws:
+    now = time.monotonic()
+    checked_at = _user_has_camera_cache.get(user_id)
+    if checked_at is None or now - checked_at >= _USER_CAMERA_TTL_SEC:
+        coll = get_cameras_collection()
+        # Existence only: the (user_id, camera_id) index answers this via its
+        # user_id prefix and stops at the first hit, no document is fetched
+        if coll.count_documents({"user_id": user_id}, limit=1) == 0:
+            _user_has_camera_cache.pop(user_id, None)
+            raise HTTPException(status_code=404, detail="No cameras found for this user_id in Vision database")
+        _user_has_camera_cache[user_id] = now
+        _user_has_camera_cache.move_to_end(user_id)
+        while _user_has_camera_cache and (
+            len(_user_has_camera_cache) > _USER_CAMERA_CACHE_SIZE
+            or now - next(iter(_user_has_camera_cache.values())) >= _USER_CAMERA_TTL_SEC
+        ):
+            _user_has_camera_cache.popitem(last=False)
+
+    if not _SIGNALING_WS:
         raise HTTPException(status_code=500, detail="SIGNALING_WS environment variable is not configured on Vision backend")
 
-    signaling_url = signaling_ws.rstrip("/") + f"/viewer:{user_id}"
-
-    ice_servers = [
-        {"urls": "stun:stun.l.google.com:19302"},
-    ]
-
-    aws_turn_ip = os.getenv("AWS_TURN_IP")
-    aws_turn_port = os.getenv("AWS_TURN_PORT")
-    aws_turn_user = os.getenv("AWS_TURN_USER")
-    aws_turn_pass = os.getenv("AWS_TURN_PASS")
-
-    if aws_turn_ip and aws_turn_port and aws_turn_user and aws_turn_pass:
-        ice_servers.append(
-            {
-                "urls": [
-                    f"turn:{aws_turn_ip}:{aws_turn_port}?transport=udp",
-                    f"turn:{aws_turn_ip}:{aws_turn_port}?transport=tcp",
-                ],
-                "username": aws_turn_user,
-                "credential": aws_turn_pass,
-            }
-        )
+    signaling_url = _SIGNALING_WS + f"/viewer:{user_id}"
 
-    return WebRTCConfig(signaling_url=signaling_url, ice_servers=ice_servers)
+    return WebRTCConfig(signaling_url=signaling_url, ice_servers=_ICE_SERVERS)
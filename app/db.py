@@ -10,8 +10,10 @@ Think of it like:
 """
 
 import os
+from datetime import timezone
 from typing import Optional
 from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo import MongoClient
 
 # Load settings from .env file
@@ -21,8 +23,17 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "vision_core")
 
+# All dates in MongoDB are UTC; tz_aware makes them come back as aware
+# datetimes so they compare cleanly with datetime.now(timezone.utc)
+_CLIENT_OPTIONS = {"tz_aware": True, "tzinfo": timezone.utc}
+
 # Store connection (we only create it once to save memory)
 _client: Optional[MongoClient] = None
+_async_client: Optional[AsyncIOMotorClient] = None
+
+# Same for collections: indexes are ensured once, then the handle is reused
+_cameras_coll = None
+_agents_coll = None
 
 
 def get_client() -> MongoClient:
@@ -35,10 +46,23 @@ def get_client() -> MongoClient:
     global _client
     if _client is None:
         print("📡 Connecting to MongoDB...")
-        _client = MongoClient(MONGODB_URI)
+        _client = MongoClient(MONGODB_URI, **_CLIENT_OPTIONS)
     return _client
 
 
+def get_async_client() -> AsyncIOMotorClient:
+    """
+    Get the async MongoDB connection (for code running inside asyncio).
+    
+    Same idea as get_client(), but every operation must be awaited, so
+    other tasks keep running while we wait for MongoDB.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncIOMotorClient(MONGODB_URI, **_CLIENT_OPTIONS)
+    return _async_client
+
+
 def get_database():
     """Get the main database where all our data is stored."""
     client = get_client()
@@ -54,13 +78,18 @@ def get_cameras_collection():
     
     Returns: cameras collection from MongoDB
     """
-    db = get_database()
-    coll = db["cameras"]
-    
-    # Make sure we don't have duplicate cameras for same user+camera combo
-    coll.create_index([("user_id", 1), ("camera_id", 1)], unique=True)
-    
-    return coll
+    global _cameras_coll
+    if _cameras_coll is None:
+        coll = get_database()["cameras"]
+        
+        # Make sure we don't have duplicate cameras for same user+camera combo
+        coll.create_index([("user_id", 1), ("camera_id", 1)], unique=True)
+        
+        # Agents look their camera up by camera_id alone
+        coll.create_index([("camera_id", 1)])
+        
+        _cameras_coll = coll
+    return _cameras_coll
 
 
 def get_agents_collection():
@@ -72,10 +101,40 @@ def get_agents_collection():
     
     Returns: agents collection from MongoDB
     """
-    db = get_database()
-    coll = db["agents"]
+    global _agents_coll
+    if _agents_coll is None:
+        coll = get_database()["agents"]
+        
+        # Make sure each agent_id is unique (no duplicates)
+        coll.create_index([("agent_id", 1)], unique=True)
+        
+        # The scheduler looks agents up by status and time window all the time
+        coll.create_index([("status", 1), ("start_at", 1), ("end_at", 1)], name="status_window")
+        
+        # Per-camera agent lookups ("agents of these cameras", optionally by status)
+        coll.create_index([("camera_id", 1), ("status", 1)])
+        
+        _agents_coll = coll
+    return _agents_coll
+
+
+def get_agents_collection_async():
+    """
+    Async version of get_agents_collection() (same collection, motor handle).
     
-    # Make sure each agent_id is unique (no duplicates)
-    coll.create_index([("agent_id", 1)], unique=True)
+    Returns: agents collection whose operations must be awaited
+    """
+    # Indexes are managed by the normal (sync) helper
+    get_agents_collection()
+    return get_async_client()[MONGODB_DB_NAME]["agents"]
+
+
+def get_cameras_collection_async():
+    """
+    Async version of get_cameras_collection() (same collection, motor handle).
     
-    return coll
+    Returns: cameras collection whose operations must be awaited
+    """
+    # Indexes are managed by the normal (sync) helper
+    get_cameras_collection()
+    return get_async_client()[MONGODB_DB_NAME]["cameras"]
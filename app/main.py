@@ -1,17 +1,19 @@
 import asyncio
+import importlib.util
 import subprocess
 import sys
 from pathlib import Path
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 from app.api.cameras import router as cameras_router
 from app.api.agents import router as agents_router
 from app.agent_scheduler import start_agent_scheduler
 
 
-app = FastAPI(title="Vision Core Backend")
+app = FastAPI(title="Vision Core Backend", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,24 +28,28 @@ APP_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = APP_DIR.parent
 
 SENDER_MODULE = "app.streamer.sender_stream"
-SENDER_PATH = APP_DIR / "streamer" / "sender_stream.py"
 
 
 @app.on_event("startup")
 async def start_live_sender_background() -> None:
-    if not SENDER_PATH.exists():
+    # Check the module is importable (not just that a file exists) before
+    # paying for a whole new Python process
+    if importlib.util.find_spec(SENDER_MODULE) is None:
         return
 
     cmd = [sys.executable, "-m", SENDER_MODULE]
     try:
-        subprocess.Popen(cmd, cwd=str(PROJECT_ROOT))
+        # Own session so it doesn't get our signals; no inherited sockets/fds
+        subprocess.Popen(cmd, cwd=str(PROJECT_ROOT), start_new_session=True, close_fds=True)
     except Exception:
         pass
 
 
 @app.on_event("startup")
 async def start_background_schedulers() -> None:
-    await start_agent_scheduler()
+    # Agents themselves run in the sender process (it owns the frames);
+    # here we only keep their statuses up to date
+    await start_agent_scheduler(run_agents=False)
 
 
 @app.get("/")
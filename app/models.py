@@ -75,6 +75,12 @@ class WebRTCConfig(BaseModel):
 # AGENT MODELS - Store Automation Rules
 # ===========================
 
+# Agent status values (stored as-is in MongoDB and returned by the API).
+# Shared constants so the scheduler, API and streamer never drift apart.
+AGENT_STATUS_PENDING = "pending"
+AGENT_STATUS_RUNNING = "running"
+AGENT_STATUS_TERMINATED = "terminated"
+
 class AgentRule(BaseModel):
     """
     A single rule/condition for an agent.
@@ -143,7 +149,7 @@ class AgentCreate(BaseModel):
     fps: int = 5  # Default: check 5 frames per second
     run_mode: str
     rules: List[AgentRule] = []
-    status: str = "pending"  # Will change to "running" when time arrives
+    status: str = AGENT_STATUS_PENDING  # Will change to "running" when time arrives
     start_at: datetime
     end_at: datetime
     created_at: datetime | None = None
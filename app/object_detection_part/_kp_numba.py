@@ -0,0 +1,149 @@
+"""
+KEYPOINT DRAW LISTS - WHAT TO DRAW FOR A FRAME OF POSES
+========================================================
+Before drawing a skeleton we have to decide, for every person:
+- which bones (skeleton edges) have BOTH ends visible
+- which joints (keypoints) are visible and confident enough
+
+Think of it like:
+Going over a join-the-dots sheet and circling only the dots that exist,
+before picking up the pen.
+
+The keypoint circles are then stamped into the image in one go: a circle
+is always the same handful of pixels, so they are worked out once and
+copied to every keypoint, instead of two OpenCV calls per keypoint.
+
+Both are plain numeric loops, so they are compiled with numba when numba
+is installed. Without numba the same result is computed with NumPy.
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional
+    njit = None
+
+
+def _build_draw_lists_np(
+    kpts: np.ndarray,
+    confs: np.ndarray,
+    skel_idx: np.ndarray,
+    conf_th: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    visible = (kpts[..., 0] > 0) & (kpts[..., 1] > 0)
+    # Persons with no keypoint above conf_th are skipped entirely
+    visible &= (confs.max(axis=1, initial=0.0) > conf_th)[:, None]
+    edge_mask = visible[:, skel_idx[:, 0]] & visible[:, skel_idx[:, 1]]
+    person, edge = np.nonzero(edge_mask)
+    edges = kpts[person[:, None], skel_idx[edge]].astype(np.int32)
+    centers = kpts[visible & (confs > conf_th)].astype(np.int32)
+    return edges, centers
+
+
+def _build_draw_lists_loop(kpts, confs, skel_idx, conf_th):
+    n_persons, n_kpts = kpts.shape[0], kpts.shape[1]
+    n_edges = skel_idx.shape[0]
+    edges = np.empty((n_persons * n_edges, 2, 2), dtype=np.int32)
+    centers = np.empty((n_persons * n_kpts, 2), dtype=np.int32)
+    ne = 0
+    nc = 0
+    for p in range(n_persons):
+        # Nothing confident for this person (often a false positive): skip
+        # both the skeleton and the keypoints
+        best = 0.0
+        for k in range(n_kpts):
+            if confs[p, k] > best:
+                best = confs[p, k]
+        if best <= conf_th:
+            continue
+        for e in range(n_edges):
+            a = skel_idx[e, 0]
+            b = skel_idx[e, 1]
+            if kpts[p, a, 0] > 0 and kpts[p, a, 1] > 0 and kpts[p, b, 0] > 0 and kpts[p, b, 1] > 0:
+                edges[ne, 0, 0] = np.int32(kpts[p, a, 0])
+                edges[ne, 0, 1] = np.int32(kpts[p, a, 1])
+                edges[ne, 1, 0] = np.int32(kpts[p, b, 0])
+                edges[ne, 1, 1] = np.int32(kpts[p, b, 1])
+                ne += 1
+        for k in range(n_kpts):
+            if kpts[p, k, 0] > 0 and kpts[p, k, 1] > 0 and confs[p, k] > conf_th:
+                centers[nc, 0] = np.int32(kpts[p, k, 0])
+                centers[nc, 1] = np.int32(kpts[p, k, 1])
+                nc += 1
+    return edges[:ne], centers[:nc]
+
+
+_build_draw_lists = (
+    njit(cache=True)(_build_draw_lists_loop) if njit is not None else _build_draw_lists_np
+)
+
+
+def _stamp_np(img: np.ndarray, centers: np.ndarray, offsets: np.ndarray, colors: np.ndarray) -> None:
+    h, w = img.shape[:2]
+    pts = (centers[:, None, :] + offsets[None, :, :]).reshape(-1, 2)
+    cols = np.broadcast_to(colors, (len(centers),) + colors.shape).reshape(-1, 3)
+    inside = (pts[:, 0] >= 0) & (pts[:, 0] < w) & (pts[:, 1] >= 0) & (pts[:, 1] < h)
+    # Later keypoints are drawn over earlier ones, as with one call each
+    img[pts[inside, 1], pts[inside, 0]] = cols[inside]
+
+
+def _stamp_loop(img, centers, offsets, colors):
+    h, w = img.shape[0], img.shape[1]
+    for i in range(centers.shape[0]):
+        for j in range(offsets.shape[0]):
+            x = centers[i, 0] + offsets[j, 0]
+            y = centers[i, 1] + offsets[j, 1]
+            if 0 <= x < w and 0 <= y < h:
+                img[y, x, 0] = colors[j, 0]
+                img[y, x, 1] = colors[j, 1]
+                img[y, x, 2] = colors[j, 2]
+
+
+_stamp = njit(cache=True)(_stamp_loop) if njit is not None else _stamp_np
+
+
+def stamp_keypoints(img: np.ndarray, centers: np.ndarray, offsets: np.ndarray, colors: np.ndarray) -> None:
+    """Draw the same small stamp at every keypoint center (in place).
+
+    Args:
+        img: (H, W, 3) uint8 image to draw on
+        centers: int32 (m, 2) keypoint centers, as from build_draw_lists
+        offsets: int32 (k, 2) pixel (x, y) offsets of the stamp
+        colors: uint8 (k, 3) color of each stamp pixel
+    """
+    if len(centers):
+        _stamp(img, centers, offsets, colors)
+
+
+def build_draw_lists(
+    kpts: np.ndarray,
+    confs: np.ndarray,
+    skel_idx: np.ndarray,
+    conf_th: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Work out what to draw for all persons in a frame.
+
+    Args:
+        kpts: (persons, keypoints, 2) keypoint coordinates; a point is
+            visible when both coordinates are positive
+        confs: (persons, keypoints) keypoint confidences
+        skel_idx: (edges, 2) 0-based keypoint index pairs
+        conf_th: minimum confidence for a keypoint to get a circle
+
+    Persons whose best keypoint confidence is not above ``conf_th`` are
+    left out completely.
+
+    Returns:
+        (edges, centers)
+        - edges: int32 (n, 2, 2) line segments, ready for cv2.polylines
+        - centers: int32 (m, 2) keypoint centers, ready for cv2.circle
+    """
+    return _build_draw_lists(
+        np.ascontiguousarray(kpts, dtype=np.float32),
+        np.ascontiguousarray(confs, dtype=np.float32),
+        np.ascontiguousarray(skel_idx, dtype=np.int32),
+        float(conf_th),
+    )
@@ -0,0 +1,218 @@
+"""
+BATCHED RUNNER - ONE YOLO CALL FOR MANY FRAMES
+===============================================
+Every running agent asks for detections on its own camera frame. Running
+those one by one leaves the GPU mostly idle (batch size 1).
+
+This module collects detection requests for a few milliseconds and sends
+them to YOLO together:
+- up to BATCH frames per call (DETECTION_BATCH)
+- never waiting longer than MAX_WAIT_MS for more frames to arrive
+  (DETECTION_BATCH_WAIT_MS)
+- one call per model (agents may use different models)
+- the frames go in as ONE stacked (N, 3, H, W) tensor
+
+The YOLO call itself runs on a dedicated detection thread so the event
+loop (and the WebRTC streams on it) keeps running during inference.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+from app.object_detection_part.object_detection import detections_from_result
+
+# Size these to the deployment: about one frame per camera with agents
+# per batch, and a wait well under one frame interval. TensorRT engines
+# are built for batches up to BATCH (see load_model).
+BATCH = int(os.getenv("DETECTION_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("DETECTION_BATCH_WAIT_MS", "5"))
+
+# One thread for all YOLO forwards. The GPU runs one batch at a time
+# anyway, and a thread of its own keeps inference from queueing behind
+# (or blocking) other to_thread() work such as model loading.
+_DETECT_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-detect")
+
+# CUDA stream per device for the forwards (see _forward)
+_cuda_streams: Dict[torch.device, "torch.cuda.Stream"] = {}
+
+# Pinned host staging buffer per batch shape (see _staging_buffer). Only
+# touched from the detection thread.
+_pinned: Dict[Tuple[int, ...], torch.Tensor] = {}
+
+# (model, frame, future to resolve with the detections)
+_Request = Tuple[YOLO, np.ndarray, "asyncio.Future[List[Dict[str, Any]]]"]
+
+
+def _model_device(model: YOLO) -> torch.device:
+    """Device the model runs on (CPU until its first forward moved it).
+
+    Once the model has run, its predictor knows the device; that also
+    covers exported models (TensorRT engines), which have no weights to ask.
+    """
+    device = getattr(getattr(model, "predictor", None), "device", None)
+    if device is not None:
+        return device
+    try:
+        return next(model.model.parameters()).device
+    except (AttributeError, StopIteration, TypeError):
+        return torch.device("cpu")  # exported models: Ultralytics moves the input itself
+
+
+def _input_dtype(model: YOLO) -> torch.dtype:
+    """Input dtype of the model: half for FP16 models, else float."""
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    return torch.float16 if getattr(backend, "fp16", False) else torch.float32
+
+
+def _staging_buffer(shape: Tuple[int, ...]) -> torch.Tensor:
+    """Pinned uint8 host buffer of ``shape``.
+
+    Copies from pinned (page-locked) memory go straight to the GPU by DMA;
+    from ordinary memory torch first copies into a pinned buffer of its
+    own. One buffer per shape is enough: forwards run one at a time on the
+    detection thread and _forward synchronizes its stream before
+    returning, so the previous upload from it has always finished.
+    """
+    buffer = _pinned.get(shape)
+    if buffer is None:
+        buffer = _pinned[shape] = torch.empty(shape, dtype=torch.uint8, pin_memory=True)
+    return buffer
+
+
+def _stack_frames(
+    frames: List[np.ndarray], device: torch.device, dtype: torch.dtype = torch.float32
+) -> Optional[torch.Tensor]:
+    """Stack same-sized BGR frames into one RGB ``dtype`` (N, 3, H, W) tensor in [0, 1].
+
+    That is the input Ultralytics builds itself from a list of images (one
+    letterbox + copy per image, then a stack); a ready tensor skips all of
+    it. The frames are uploaded as uint8 (a quarter of the float size) and
+    channel swap, layout change, scaling and the cast to ``dtype`` then
+    run on ``device`` as a single read and write per channel, instead of
+    one pass over the whole batch for each step. For FP16 models the
+    result is already half, so Ultralytics doesn't convert it again. For
+    CUDA the frames are stacked into a pinned buffer and uploaded from
+    there. Returns None if the frames differ in size.
+    """
+    shape = frames[0].shape
+    if any(frame.shape != shape for frame in frames):
+        return None
+    if device.type == "cuda":
+        host = _staging_buffer((len(frames),) + shape)
+        np.stack(frames, out=host.numpy())
+        batch = host.to(device, non_blocking=True)
+    else:
+        batch = torch.from_numpy(np.stack(frames)).to(device)
+    out = torch.empty((len(frames), 3) + shape[:2], dtype=dtype, device=device)
+    for c in range(3):
+        # BGR channel 2 - c is RGB channel c
+        torch.mul(batch[..., 2 - c], 1.0 / 255.0, out=out[:, c])
+    return out
+
+
+def _forward(model: YOLO, frames: List[np.ndarray]) -> list:
+    """Run one batched forward (called on the detection thread).
+
+    On CUDA the forward runs on a stream of its own rather than the
+    default stream, so the GPU can overlap it with work other code queues
+    meanwhile (e.g. the pose detector's uploads) instead of serialising
+    everything on one queue. The stream is synchronized before returning,
+    so the results are complete whichever stream reads them.
+    """
+    device = _model_device(model)
+    if device.type != "cuda":
+        batch = _stack_frames(frames, device, _input_dtype(model))
+        return model(frames if batch is None else batch, verbose=False)
+
+    stream = _cuda_streams.get(device)
+    if stream is None:
+        stream = _cuda_streams[device] = torch.cuda.Stream(device=device)
+    with torch.cuda.stream(stream):
+        batch = _stack_frames(frames, device, _input_dtype(model))
+        results = model(frames if batch is None else batch, verbose=False)
+    stream.synchronize()
+    return results
+
+
+class BatchedDetector:
+    """Coalesces concurrent ``detect`` calls into batched YOLO forwards."""
+
+    def __init__(self, max_batch: int = BATCH, max_wait_ms: float = MAX_WAIT_MS) -> None:
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def detect(self, model: YOLO, frame_bgr: np.ndarray) -> List[Dict[str, Any]]:
+        """Return detections for ``frame_bgr``, computed in a shared batch."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self._max_batch * 4)
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((model, frame_bgr, fut))
+        return await fut
+
+    async def _collect(self) -> List[_Request]:
+        """Wait for one request, then take more until the batch is full or time is up."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._max_wait
+        while len(batch) < self._max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+
+            # One forward per model on a single stacked input tensor (the
+            # engine sends frames already letterboxed to the model size)
+            by_model: Dict[int, Tuple[YOLO, List[_Request]]] = {}
+            for request in batch:
+                by_model.setdefault(id(request[0]), (request[0], []))[1].append(request)
+
+            for model, requests in by_model.values():
+                # Requests whose agent was stopped meanwhile need no work
+                requests = [r for r in requests if not r[2].done()]
+                if not requests:
+                    continue
+                frames = [frame for _, frame, _ in requests]
+                try:
+                    results = await asyncio.get_running_loop().run_in_executor(
+                        _DETECT_POOL, _forward, model, frames
+                    )
+                    for (_, _, fut), res in zip(requests, results):
+                        if not fut.done():
+                            fut.set_result(detections_from_result(res))
+                except Exception as exc:
+                    for _, _, fut in requests:
+                        if not fut.done():
+                            fut.set_exception(exc)
+
+
+# One shared batcher per process (like SharedFrameHub)
+_batched_detector = BatchedDetector()
+
+
+async def detect_batched(model: YOLO, frame_bgr: np.ndarray) -> List[Dict[str, Any]]:
+    """Run ``model`` on ``frame_bgr`` batched together with other callers."""
+    return await _batched_detector.detect(model, frame_bgr)
@@ -1,13 +1,120 @@
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Mapping, Optional
+
+import torch
 from ultralytics import YOLO
-from typing import Dict
+
+from app.object_detection_part.batched_runner import BATCH
+from app.object_detection_part.object_detection import (
+    CALIB_MIN_IMAGES,
+    DETECT_IMGSZ,
+    _export_engine,
+    _sample_calib_images,
+)
+
+logger = logging.getLogger("vision_core.detector")
 
 _model_cache: Dict[str, YOLO] = {}
+# Models may be loaded from worker threads; make sure each is loaded once
+_model_lock = threading.Lock()
+
+# Same switches as the pose detector: DETECTION_TRT=1 runs agent models as
+# TensorRT engines on CUDA machines, INT8 with DETECTION_INT8=1
+_USE_TRT = os.getenv("DETECTION_TRT", "0") == "1"
+_USE_INT8 = os.getenv("DETECTION_INT8", "0") == "1"
+
+# INT8 calibration images for the agent models: plain camera snapshots
+# (no drawings), e.g. a few hundred JPEGs grabbed from each camera. The
+# pose detector's saved frames don't do: they have skeletons drawn on.
+DETECT_CALIB_FRAMES_DIR = Path(os.getenv("DETECTION_CALIB_FRAMES", "calib_frames"))
+DETECT_CALIB_DIR = Path("calib_detect")
+
+
+def _write_detect_calib_yaml(
+    names: Mapping[int, str],
+    frames_dir: Path = DETECT_CALIB_FRAMES_DIR,
+    calib_dir: Path = DETECT_CALIB_DIR,
+) -> Optional[Path]:
+    """Build a detection calibration dataset over the camera snapshots.
+
+    Returns None if ``frames_dir`` has too few images.
+    """
+    if not _sample_calib_images(frames_dir, calib_dir):
+        return None
+    yaml_path = calib_dir / "calib.yaml"
+    lines = [f"path: {calib_dir.absolute()}", "train: images", "val: images", "names:"]
+    lines += [f"  {idx}: {name}" for idx, name in sorted(names.items())]
+    yaml_path.write_text("\n".join(lines) + "\n")
+    return yaml_path
+
+
+def _engine_path(weights: Path, batch: int, imgsz: int, int8: bool = False) -> Path:
+    """Where the engine of ``weights`` built for these settings is cached.
+
+    An engine only accepts the batch sizes and image size it was built
+    for, so both are part of the name: changing DETECTION_BATCH exports a
+    new engine instead of loading one whose profile is too small.
+    """
+    suffix = "_int8" if int8 else ""
+    return weights.with_name(f"{weights.stem}_b{batch}_{imgsz}{suffix}.engine")
+
+
+def _load_engine(model_id: str) -> Optional[YOLO]:
+    """Load ``model_id`` as a TensorRT engine, exporting it once if needed.
+
+    Agent frames reach the model in batches of up to BATCH letterboxed
+    DETECT_IMGSZ images (see batched_runner), so the engine is built for
+    exactly that: dynamic batch 1..BATCH at a fixed image size. INT8
+    engines are calibrated on the camera snapshots in
+    DETECT_CALIB_FRAMES_DIR; without enough of them the engine is FP16.
+    Returns None for models that can't be exported (not a .pt).
+    """
+    weights = Path(model_id)
+    if weights.suffix != ".pt":
+        return None
+
+    export_args = dict(half=True, dynamic=True, batch=BATCH, imgsz=DETECT_IMGSZ, workspace=4, device=0)
+    engine_path = _engine_path(weights, BATCH, DETECT_IMGSZ)
+    if _USE_INT8:
+        int8_path = _engine_path(weights, BATCH, DETECT_IMGSZ, int8=True)
+        calib_yaml = None if int8_path.exists() else _write_detect_calib_yaml(YOLO(model_id).names)
+        if int8_path.exists():
+            engine_path = int8_path
+        elif calib_yaml is not None:
+            engine_path = int8_path
+            export_args.update(half=False, int8=True, data=str(calib_yaml))
+        else:
+            logger.warning(
+                "⚠️ Need %d+ camera images in %s to calibrate INT8, using FP16",
+                CALIB_MIN_IMAGES, DETECT_CALIB_FRAMES_DIR,
+            )
+
+    if not engine_path.exists():
+        logger.info("Exporting TensorRT engine for %s to %s (one-time)...", model_id, engine_path)
+        _export_engine(model_id, engine_path, **export_args)
+    # Agents read boxes only; the engine file doesn't say which task it is
+    return YOLO(str(engine_path), task="detect")
+
+
+def _load(model_id: str) -> YOLO:
+    if _USE_TRT and torch.cuda.is_available():
+        try:
+            engine = _load_engine(model_id)
+            if engine is not None:
+                return engine
+        except Exception as exc:
+            logger.warning("⚠️ TensorRT export of %s failed, using PyTorch: %s", model_id, exc)
+    return YOLO(model_id)
 
 
 def _get_or_load_model(model_id: str) -> YOLO:
     """Load a YOLO model by ``model_id`` using a simple in-memory cache."""
     if model_id in _model_cache:
         return _model_cache[model_id]
-    model = YOLO(model_id)
-    _model_cache[model_id] = model
-    return model
\ No newline at end of file
+    with _model_lock:
+        if model_id not in _model_cache:
+            _model_cache[model_id] = _load(model_id)
+        return _model_cache[model_id]
@@ -1,10 +1,251 @@
+import logging
 import os
+import queue
+import random
+import shutil
+import threading
 import cv2
 import numpy as np
 from pathlib import Path
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
+import torch
+from av import VideoFrame
 from ultralytics import YOLO
+from ultralytics.utils import ops
+
+from app.object_detection_part._kp_numba import build_draw_lists, stamp_keypoints
+
+logger = logging.getLogger("vision_core.detector")
+
+POSE_WEIGHTS = "yolov8m-pose.pt"
+POSE_IMGSZ = 640
+DETECT_IMGSZ = 640  # input size of the agent detection models
+LETTERBOX_FILL = 114  # same grey Ultralytics pads with
+FRAMES_DIR = Path("detected_frames")  # where annotate() saves pose frames
+CALIB_DIR = Path("calib")  # INT8 calibration set, sampled from FRAMES_DIR
+CALIB_MAX_IMAGES = 300
+CALIB_MIN_IMAGES = 32
+
+
+def letterbox(
+    bgr: np.ndarray,
+    imgsz: int = POSE_IMGSZ,
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Resize ``bgr`` to fit an ``imgsz`` x ``imgsz`` square, keeping aspect ratio.
+
+    Returns ``(image, ratio, (pad_x, pad_y))``; a point in the letterboxed
+    image maps back to the original frame as ``(p - pad) / ratio``.
+    If ``out`` is given it is reused instead of allocating a new image.
+    """
+    h, w = bgr.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+
+    if out is None or out.shape != (imgsz, imgsz, 3):
+        out = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+    out[...] = LETTERBOX_FILL
+    out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(
+        bgr, (new_w, new_h), interpolation=cv2.INTER_LINEAR
+    )
+    return out, ratio, (pad_x, pad_y)
+
+
+# CPU backends the pose model can be exported to (DETECTION_BACKEND env),
+# mapped to the file/directory Ultralytics writes next to the ``.pt`` file
+CPU_BACKENDS = {
+    "onnx": lambda w: Path(w).with_suffix(".onnx"),
+    "openvino": lambda w: Path(w).with_name(Path(w).stem + "_openvino_model"),
+}
+
+
+def preprocess_for_yolo(bgr: np.ndarray, imgsz: int = DETECT_IMGSZ) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Letterbox a frame to the model input size, ready for ``model(...)``.
+
+    Ultralytics would do the same resize itself on every call; doing it
+    once lets every model / agent on a camera reuse the small image.
+    Map results back with ``unletterbox_detections``.
+    """
+    return letterbox(bgr, imgsz)
+
+
+def letterbox_frame(frame: VideoFrame, imgsz: int = DETECT_IMGSZ) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """Same result as ``preprocess_for_yolo``, but straight from a decoded frame.
+
+    libswscale converts the (usually YUV) frame to BGR and scales it to the
+    model size in one pass, so no full-resolution BGR image is made just
+    to be shrunk again.
+    """
+    h, w = frame.height, frame.width
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+
+    out = np.full((imgsz, imgsz, 3), LETTERBOX_FILL, dtype=np.uint8)
+    out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = frame.reformat(
+        width=new_w, height=new_h, format="bgr24"
+    ).to_ndarray()
+    return out, ratio, (pad_x, pad_y)
+
+
+def unletterbox_detections(
+    dets: List[Dict[str, Any]],
+    ratio: float,
+    pad: Tuple[int, int],
+    shape: Tuple[int, int],
+) -> List[Dict[str, Any]]:
+    """Move detection boxes from letterboxed to original frame coordinates (in place)."""
+    h, w = shape[:2]
+    pad_x, pad_y = pad
+    for det in dets:
+        x1, y1, x2, y2 = det["bbox"]
+        det["bbox"] = [
+            min(max(int((x1 - pad_x) / ratio), 0), w - 1),
+            min(max(int((y1 - pad_y) / ratio), 0), h - 1),
+            min(max(int((x2 - pad_x) / ratio), 0), w - 1),
+            min(max(int((y2 - pad_y) / ratio), 0), h - 1),
+        ]
+    return dets
+
+
+def _circle_stamp(radius: int, fill: Tuple[int, int, int], border: Tuple[int, int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Pixels of a filled circle with a 1px border, as drawn by cv2.circle.
+
+    Returns ``(offsets, colors)`` for stamp_keypoints: int32 (x, y) offsets
+    from the center and the uint8 color of each of those pixels.
+    """
+    size = 2 * radius + 3
+    c = size // 2
+    canvas = np.zeros((size, size, 3), dtype=np.uint8)
+    drawn = np.zeros((size, size), dtype=np.uint8)
+    for img, fill_color, border_color in ((canvas, fill, border), (drawn, 255, 255)):
+        cv2.circle(img, (c, c), radius, fill_color, -1)
+        cv2.circle(img, (c, c), radius, border_color, 1)
+    ys, xs = np.nonzero(drawn)
+    offsets = np.stack([xs - c, ys - c], axis=1).astype(np.int32)
+    return offsets, np.ascontiguousarray(canvas[ys, xs])
+
+
+def _sample_calib_images(frames_dir: Path, calib_dir: Path) -> bool:
+    """Copy a random sample of the images in ``frames_dir`` to ``calib_dir/images``.
+
+    Returns False (copying nothing) if there are fewer than CALIB_MIN_IMAGES.
+    """
+    frames = sorted(p for pattern in ("*.jpg", "*.jpeg", "*.png") for p in frames_dir.glob(pattern))
+    if len(frames) < CALIB_MIN_IMAGES:
+        return False
+    images_dir = calib_dir / "images"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    for frame in random.sample(frames, min(len(frames), CALIB_MAX_IMAGES)):
+        shutil.copy2(frame, images_dir / frame.name)
+    return True
+
+
+def _write_calib_yaml(frames_dir: Path = FRAMES_DIR, calib_dir: Path = CALIB_DIR) -> Optional[Path]:
+    """Build the INT8 calibration dataset from saved pose frames.
+
+    TensorRT INT8 needs real frames from the cameras to pick its value
+    ranges; the frames ``annotate()`` saved are exactly that. A random
+    sample is copied into ``calib_dir/images`` and a pose dataset yaml
+    pointing at it is written. Returns None if there are too few frames.
+    """
+    if not _sample_calib_images(frames_dir, calib_dir):
+        return None
+
+    yaml_path = calib_dir / "calib.yaml"
+    yaml_path.write_text(
+        f"path: {calib_dir.absolute()}\n"
+        "train: images\n"
+        "val: images\n"
+        "kpt_shape: [17, 3]\n"
+        "names:\n"
+        "  0: person\n"
+    )
+    return yaml_path
+
+
+def _export_engine(weights: str, engine_path: Path, **export_args) -> Path:
+    """Export ``weights`` as a TensorRT engine to ``engine_path``.
+
+    Ultralytics always writes ``<weights>.engine``, which may already be
+    another engine of the same weights (the FP16 one, for an INT8
+    export). Such a file is moved aside for the export and put back, so
+    only ``engine_path`` is ever replaced.
+    """
+    default_path = Path(weights).with_suffix(".engine")
+    aside = None
+    if default_path != engine_path and default_path.exists():
+        aside = default_path.with_name(default_path.name + ".keep")
+        default_path.replace(aside)
+    try:
+        exported = Path(YOLO(weights).export(format="engine", **export_args))
+        if exported != engine_path:
+            exported.replace(engine_path)
+    finally:
+        if aside is not None:
+            aside.replace(default_path)
+    return engine_path
+
+
+def _load_pose_model(
+    weights: str,
+    device: str,
+    use_trt: bool,
+    backend: str = "torch",
+    int8: bool = False,
+) -> YOLO:
+    """Load the pose model, optionally as a TensorRT FP16 engine.
+
+    The engine is exported once next to the ``.pt`` file and reused on
+    later starts (exporting takes minutes, loading takes seconds).
+    TensorRT needs a CUDA device, so on CPU the ``.pt`` model is used,
+    unless ``backend`` asks for an ONNX Runtime or OpenVINO export, which
+    run the same network several times faster than PyTorch on a CPU.
+
+    With ``int8`` the TensorRT engine is INT8, calibrated on saved frames
+    (see _write_calib_yaml); it is cached as ``<weights>_int8.engine``.
+
+    The detector always feeds one POSE_IMGSZ letterbox per call, so the
+    engines are built for exactly that shape: a static engine has a single
+    optimization profile and TensorRT can tune its kernels for it.
+    """
+    if use_trt and int8 and device != "cpu":
+        engine_path = Path(weights).with_name(Path(weights).stem + "_int8.engine")
+        if not engine_path.exists():
+            calib_yaml = _write_calib_yaml()
+            if calib_yaml is None:
+                logger.warning("⚠️ Need %d+ frames in %s to calibrate INT8, using FP16", CALIB_MIN_IMAGES, FRAMES_DIR)
+            else:
+                logger.info("Exporting TensorRT INT8 engine to %s (one-time)...", engine_path)
+                _export_engine(
+                    weights, engine_path, int8=True, data=str(calib_yaml), batch=1,
+                    imgsz=POSE_IMGSZ, workspace=4, device=device,
+                )
+        if engine_path.exists():
+            return YOLO(str(engine_path), task="pose")
+
+    if use_trt and device != "cpu":
+        engine_path = Path(weights).with_suffix(".engine")
+        if not engine_path.exists():
+            logger.info("Exporting TensorRT FP16 engine to %s (one-time)...", engine_path)
+            _export_engine(weights, engine_path, half=True, batch=1, imgsz=POSE_IMGSZ, workspace=4, device=device)
+        # Engines are bound to the GPU they were built on; no .to(device)
+        return YOLO(str(engine_path), task="pose")
+
+    if device == "cpu" and backend in CPU_BACKENDS:
+        export_path = CPU_BACKENDS[backend](weights)
+        if not export_path.exists():
+            logger.info("Exporting %s model to %s (one-time)...", backend, export_path)
+            # Input is always the POSE_IMGSZ letterbox, so a static shape is fine
+            exported = YOLO(weights).export(format=backend, imgsz=POSE_IMGSZ, simplify=True)
+            export_path = Path(exported)
+        return YOLO(str(export_path), task="pose")
+
+    model = YOLO(weights)
+    model.to(device)
+    return model
 
 
 class YOLOv8PoseDetector:
@@ -12,23 +253,34 @@ class YOLOv8PoseDetector:
     Detects human poses in video frames using YOLOv8 pose model.
     Draws skeleton keypoints and saves frames when poses are detected.
     """
-    def __init__(self, conf: float = 0.5, device: str = "cpu"):
+    def __init__(
+        self,
+        conf: float = 0.5,
+        device: str = "cpu",
+        use_trt: bool = False,
+        backend: str = "torch",
+        int8: bool = False,
+    ):
         self.device = device
-        print(f"[detector] Loading YOLOv8 Pose Detection model...")
+        logger.info("Loading YOLOv8 Pose Detection model...")
         
         # Load the pre-trained YOLOv8 medium pose model
-        self.model = YOLO("yolov8m-pose.pt")
-        self.model.to(self.device)
+        self.model = _load_pose_model(POSE_WEIGHTS, self.device, use_trt, backend, int8)
         
         self.conf = conf  # Confidence threshold for detections
         self.pose_detected = False  # Flag to track if pose was detected in current frame
         self.detection_count = 0  # Counter for total detections
         
         # Create directory to save detected frames
-        self.frames_dir = Path("detected_frames")
+        self.frames_dir = FRAMES_DIR
         self.frames_dir.mkdir(exist_ok=True)
-        print(f"[detector] ✅ YOLOv8 Pose model loaded successfully")
-        print(f"[detector] Detected frames will be saved to: {self.frames_dir.absolute()}")
+        
+        # Frames are written to disk by a background thread so that slow disk
+        # I/O never stalls detection; when it falls behind, saves are dropped
+        self._save_q: "queue.Queue[Tuple[Path, np.ndarray]]" = queue.Queue(maxsize=32)
+        threading.Thread(target=self._save_worker, name="pose-frame-writer", daemon=True).start()
+        logger.info("✅ YOLOv8 Pose model loaded successfully")
+        logger.info("Detected frames will be saved to: %s", self.frames_dir.absolute())
         
         self.keypoint_names = [
             "nose", "left_eye", "right_eye", "left_ear", "right_ear",
@@ -47,6 +299,114 @@ class YOLOv8PoseDetector:
         self.skeleton_color = (0, 255, 255)
         self.keypoint_color = (0, 255, 0)
         self.keypoint_radius = 5
+        # Keypoint circle (green, white border) as a pixel stamp
+        self._kp_offsets, self._kp_colors = _circle_stamp(
+            self.keypoint_radius, self.keypoint_color, (255, 255, 255)
+        )
+        # Skeleton as 0-based (edges, 2) index array for vectorized masking
+        self._skel_idx = np.array(self.skeleton, dtype=np.int32) - 1
+        
+        # Persistent input buffers: the letterboxed frame and the model input
+        # tensor are written in place every frame instead of re-allocated
+        self._letterbox_buf = np.empty((POSE_IMGSZ, POSE_IMGSZ, 3), dtype=np.uint8)
+        self._input_buf = torch.empty((1, 3, POSE_IMGSZ, POSE_IMGSZ), dtype=torch.float32, device=self.device)
+        self._capture_cuda_graph()
+
+    def _save_worker(self) -> None:
+        """Write queued annotated frames to disk as JPEG (runs in its own thread)."""
+        while True:
+            filename, image = self._save_q.get()
+            try:
+                cv2.imwrite(str(filename), image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                logger.debug("💾 Frame saved: %s", filename)
+            except Exception as e:
+                logger.warning("⚠️ Failed to save frame: %s", e)
+
+    def _capture_cuda_graph(self) -> None:
+        """Record the model forward as a CUDA graph, replayed for every frame.
+
+        The letterboxed input always has the same shape, so one recorded
+        graph can be replayed with new data in ``self._input_buf``; this
+        skips the hundreds of separate kernel launches of a YOLO forward.
+        Only used for PyTorch models on CUDA (TensorRT engines already do
+        their own kernel scheduling). Any failure leaves the normal path on.
+        """
+        self._graph = None
+        if not str(self.device).startswith("cuda") or not isinstance(self.model.model, torch.nn.Module):
+            return
+        try:
+            net = self.model.model.fuse().eval()
+            with torch.inference_mode():
+                # Warm up on a side stream first, as CUDA graphs require
+                stream = torch.cuda.Stream()
+                stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(stream):
+                    for _ in range(3):
+                        net(self._input_buf)
+                torch.cuda.current_stream().wait_stream(stream)
+
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    out = net(self._input_buf)
+            self._graph_out = out[0] if isinstance(out, (list, tuple)) else out
+            self._kpt_shape = tuple(getattr(net, "kpt_shape", (17, 3)))
+            self._graph = graph
+            logger.info("CUDA graph captured for pose model")
+        except Exception as e:
+            logger.warning("⚠️ CUDA graph capture failed, using normal inference: %s", e)
+
+    def _infer(self, bgr: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Run the pose model on ``bgr`` through the persistent input buffer.
+
+        Returns ``(keypoints, confidences)`` in original frame coordinates,
+        shaped (persons, 17, 2) and (persons, 17), or ``(None, None)`` when
+        nobody was found. ``confidences`` may be None if the model has none.
+        """
+        lb, ratio, pad = letterbox(bgr, POSE_IMGSZ, out=self._letterbox_buf)
+        with torch.inference_mode():
+            # BGR HWC uint8 -> RGB CHW float in [0, 1], written in place.
+            # A ready tensor makes Ultralytics skip its own resize/normalize.
+            src = torch.from_numpy(lb).to(self.device, non_blocking=True)
+            self._input_buf[0].copy_(src.permute(2, 0, 1).flip(0)).div_(255.0)
+
+            if self._graph is not None:
+                self._graph.replay()
+                det = ops.non_max_suppression(self._graph_out, self.conf, 0.7, nc=len(self.model.names))[0]
+                if len(det) == 0:
+                    return None, None
+                kpts = det[:, 6:].view(len(det), *self._kpt_shape)
+                conf_t = kpts[..., 2]
+                # Same as Ultralytics' Keypoints: hide low-confidence points
+                xy_t = kpts[..., :2].masked_fill(conf_t[..., None] < 0.5, 0)
+                return self._to_host(xy_t, conf_t, ratio, pad)
+
+            results = self.model(self._input_buf, conf=self.conf, verbose=False)
+            if not results or results[0].keypoints is None or len(results[0].keypoints) == 0:
+                return None, None
+            kp = results[0].keypoints
+            return self._to_host(kp.xy, kp.conf, ratio, pad)
+
+    def _to_host(
+        self,
+        xy_t: torch.Tensor,
+        conf_t: Optional[torch.Tensor],
+        ratio: float,
+        pad: Tuple[int, int],
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Finish keypoints on the device and copy them back in one transfer.
+
+        Mapping back to frame coordinates and hiding invisible points is done
+        on the model's device; xy and confidences are then packed into one
+        tensor, so there is a single device-to-host copy (and sync) per frame
+        instead of one per array plus NumPy post-processing.
+        """
+        # Hidden points stay (0, 0) so "visible" keeps meaning x > 0 and y > 0
+        hidden = (xy_t[..., 0] <= 0) | (xy_t[..., 1] <= 0)
+        xy_t = ((xy_t - xy_t.new_tensor(pad)) / ratio).masked_fill_(hidden[..., None], 0)
+        if conf_t is None:
+            return xy_t.cpu().numpy(), None
+        host = torch.cat((xy_t, conf_t[..., None].to(xy_t.dtype)), dim=-1).cpu().numpy()
+        return host[..., :2], host[..., 2]
 
     def annotate(self, bgr: np.ndarray) -> tuple:
         """
@@ -57,6 +417,10 @@ class YOLOv8PoseDetector:
             
         Returns:
             tuple: (annotated_frame, pose_detected_flag)
+
+        ``annotated_frame`` is a new image when a pose was drawn; otherwise
+        it is ``bgr`` itself (not a copy), so copy it before changing it
+        if the input must stay untouched.
         """
         # Validate input frame
         if bgr is None or bgr.size == 0:
@@ -64,90 +428,81 @@ class YOLOv8PoseDetector:
             
         try:
             h, w = bgr.shape[:2]
-            output = bgr.copy()
+            # No pose (the common case) means nothing to draw: hand the
+            # input back as-is and only copy the frame once we draw on it
+            output = bgr
             
             # Run YOLOv8 pose detection on the frame
-            results = self.model(bgr, conf=self.conf, verbose=False)
+            keypoints, confidences = self._infer(bgr)
             
             pose_detected = False
             
             # Check if any poses were detected
-            if results and len(results) > 0:
-                result = results[0]
+            if keypoints is not None:
                 
                 # If keypoints found, draw skeleton on frame
-                if result.keypoints is not None and len(result.keypoints) > 0:
+                if len(keypoints) > 0:
                     self.detection_count += 1
-                    print(f"[detector] 👤 POSE DETECTED! Count: {self.detection_count}")
+                    logger.debug("👤 POSE DETECTED! Count: %d", self.detection_count)
                     pose_detected = True
+                    output = bgr.copy()
                     
-                    # Extract keypoint coordinates and confidence scores
-                    keypoints = result.keypoints.xy.cpu().numpy()
-                    confidences = result.keypoints.conf.cpu().numpy() if result.keypoints.conf is not None else None
+                    # Work out the visible skeleton edges and confident
+                    # keypoints of all persons at once (valid keypoints have
+                    # positive coordinates; no confidences = draw all)
+                    if confidences is None:
+                        confidences = np.ones(keypoints.shape[:2], dtype=np.float32)
+                    lines, centers = build_draw_lists(keypoints, confidences, self._skel_idx, 0.3)
                     
-                    # Draw skeleton for each detected person
-                    for person_idx, person_keypoints in enumerate(keypoints):
-                        person_conf = confidences[person_idx] if confidences is not None else None
-                        
-                        # Draw skeleton lines connecting keypoints
-                        for skeleton_pair in self.skeleton:
-                            pt1_idx, pt2_idx = skeleton_pair[0] - 1, skeleton_pair[1] - 1
-                            
-                            if pt1_idx < len(person_keypoints) and pt2_idx < len(person_keypoints):
-                                pt1 = person_keypoints[pt1_idx]
-                                pt2 = person_keypoints[pt2_idx]
-                                
-                                # Only draw if both points are valid (positive coordinates)
-                                if pt1[0] > 0 and pt1[1] > 0 and pt2[0] > 0 and pt2[1] > 0:
-                                    pt1 = (int(pt1[0]), int(pt1[1]))
-                                    pt2 = (int(pt2[0]), int(pt2[1]))
-                                    cv2.line(output, pt1, pt2, self.skeleton_color, 2)
-                        
-                        # Draw keypoint circles
-                        for kpt_idx, keypoint in enumerate(person_keypoints):
-                            if keypoint[0] > 0 and keypoint[1] > 0:
-                                kpt_conf = person_conf[kpt_idx] if person_conf is not None else 1.0
-                                # Only draw keypoint if confidence is above threshold
-                                if kpt_conf > 0.3:
-                                    pt = (int(keypoint[0]), int(keypoint[1]))
-                                    # Draw filled circle (green) with white border
-                                    cv2.circle(output, pt, self.keypoint_radius, self.keypoint_color, -1)
-                                    cv2.circle(output, pt, self.keypoint_radius, (255, 255, 255), 1)
+                    # Draw skeleton lines connecting keypoints, all in a single OpenCV call
+                    if len(lines):
+                        cv2.polylines(output, list(lines), isClosed=False, color=self.skeleton_color, thickness=2)
+                    
+                    # Draw keypoint circles: filled (green) with white
+                    # border, all of them in one pass
+                    stamp_keypoints(output, centers, self._kp_offsets, self._kp_colors)
                     
                     # Add text label to frame
                     cv2.putText(output, "POSE DETECTED!", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 255, 0), 4)
                     
-                    # Save the annotated frame to disk
+                    # Save the annotated frame to disk (in the background).
+                    # The writer gets its own copy: ``output`` also goes back
+                    # to the caller, who may draw on it while the JPEG is
+                    # still being encoded.
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+                    filename = self.frames_dir / f"pose_{self.detection_count}_{timestamp}.jpg"
                     try:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-                        filename = self.frames_dir / f"pose_{self.detection_count}_{timestamp}.jpg"
-                        cv2.imwrite(str(filename), output)
-                        print(f"[detector] 💾 Frame saved: {filename}")
-                    except Exception as e:
-                        print(f"[detector] ⚠️ Failed to save frame: {e}")
+                        self._save_q.put_nowait((filename, output.copy()))
+                    except queue.Full:
+                        logger.debug("⚠️ Frame writer busy, not saving %s", filename)
             
             # Update pose detection flag
             self.pose_detected = pose_detected
             return output, pose_detected
             
         except Exception as e:
-            print(f"[detector] ❌ Error in annotate: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Error in annotate: %s", e)
             return bgr, False
 
 
 def annotate_frame_with_detections(
     frame_bgr: np.ndarray,
     detections: List[Dict[str, Any]],
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """Draw bounding boxes for the given detections on a frame.
 
     This helper is intentionally simple so it stays easy to understand.
+    The input frame is never modified: drawing happens on a copy, written
+    into ``out`` when given (same shape as ``frame_bgr``).
     """
     import cv2
 
-    output = frame_bgr.copy()
+    if out is None:
+        output = frame_bgr.copy()
+    else:
+        np.copyto(out, frame_bgr)
+        output = out
     for det in detections:
         x1, y1, x2, y2 = det["bbox"]
         label = det.get("class_name", "obj")
@@ -158,29 +513,49 @@ def annotate_frame_with_detections(
     return output
 
 
-def run_detection(model: YOLO, frame_bgr: np.ndarray) -> List[Dict[str, Any]]:
-    """Run YOLO object detection on a frame and return normalized results."""
-    results = model(frame_bgr, verbose=False)
-    dets: List[Dict[str, Any]] = []
+def run_detection(
+    model: YOLO,
+    frame_bgr: np.ndarray,
+    letterboxed: Optional[Tuple[np.ndarray, float, Tuple[int, int]]] = None,
+) -> List[Dict[str, Any]]:
+    """Run YOLO object detection on a frame and return normalized results.
+
+    ``letterboxed`` is the ``preprocess_for_yolo(frame_bgr)`` result if the
+    caller already has it; boxes are always in ``frame_bgr`` coordinates.
+    """
+    if letterboxed is None:
+        results = model(frame_bgr, verbose=False)
+        return detections_from_result(results[0]) if results else []
+    img, ratio, pad = letterboxed
+    results = model(img, imgsz=img.shape[0], verbose=False)
     if not results:
-        return dets
-    res = results[0]
+        return []
+    return unletterbox_detections(detections_from_result(results[0]), ratio, pad, frame_bgr.shape)
+
+
+def detections_from_result(res) -> List[Dict[str, Any]]:
+    """Normalize one Ultralytics result into our list-of-dicts format.
+
+    All boxes are read in one device-to-host copy and converted as whole
+    columns, instead of several small tensor reads per box.
+    """
     names = res.names
     boxes = res.boxes
-    if boxes is None:
-        return dets
-    for box in boxes:
-        cls_idx = int(box.cls[0]) if box.cls is not None else -1
-        conf = float(box.conf[0]) if box.conf is not None else 0.0
-        x1, y1, x2, y2 = box.xyxy[0].tolist()
-        dets.append(
-            {
-                "class_name": names.get(cls_idx, str(cls_idx)),
-                "confidence": conf,
-                "bbox": [int(x1), int(y1), int(x2), int(y2)],
-            }
-        )
-    return dets
+    if boxes is None or len(boxes) == 0:
+        return []
+    # Rows: x1, y1, x2, y2, [track id,] conf, cls
+    data = boxes.data.cpu().numpy()
+    bboxes = data[:, :4].astype(np.int64).tolist()
+    confs = data[:, -2].tolist()
+    classes = data[:, -1].astype(np.int64).tolist()
+    return [
+        {
+            "class_name": names.get(cls_idx, str(cls_idx)),
+            "confidence": conf,
+            "bbox": bbox,
+        }
+        for bbox, conf, cls_idx in zip(bboxes, confs, classes)
+    ]
 
 
 def load_detector_from_env():
@@ -189,4 +564,9 @@ def load_detector_from_env():
         return None
     conf = float(os.getenv("DETECTION_CONF", "0.5"))
     device = os.getenv("DETECTION_DEVICE", "cpu")
-    return YOLOv8PoseDetector(conf=conf, device=device)
+    use_trt = os.getenv("DETECTION_TRT", "0") == "1"
+    # CPU only: "onnx" (ONNX Runtime) or "openvino"; anything else = PyTorch
+    backend = os.getenv("DETECTION_BACKEND", "torch").lower()
+    # With DETECTION_TRT=1: build an INT8 instead of an FP16 engine
+    int8 = os.getenv("DETECTION_INT8", "0") == "1"
+    return YOLOv8PoseDetector(conf=conf, device=device, use_trt=use_trt, backend=backend, int8=int8)
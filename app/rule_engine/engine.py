@@ -1,26 +1,53 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple, Optional
+import asyncio
+import logging
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
 
+import numpy as np
 from av import VideoFrame
 from ultralytics import YOLO
 
 from app.models import AgentRule
 from app.object_detection_part.load_model import _get_or_load_model
+from app.object_detection_part.batched_runner import detect_batched
 from app.object_detection_part.object_detection import (
     annotate_frame_with_detections,
-    run_detection,
+    letterbox_frame,
+    unletterbox_detections,
 )
 from app.rule_engine import rule as rules_module
 
+logger = logging.getLogger("vision_core.engine")
+
+# Threads for the agents' pixel work (resize, convert, copy, draw), one per
+# core: those calls release the GIL, so agents on different cameras really
+# run in parallel. A pool of their own also keeps them from queueing
+# behind (or holding up) other to_thread() work such as model loading.
+_PIXEL_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="agent-pixels")
+
+
+def _in_pixel_pool(fn, *args):
+    """Run ``fn(*args)`` on the pixel pool and await the result."""
+    return asyncio.get_running_loop().run_in_executor(_PIXEL_POOL, fn, *args)
+
 @dataclass
 class AgentRuntime:
-    """In-memory helper representing a running agent.
+    """In-memory state of a running agent.
+
+    The scheduler's runner feeds it the camera's latest frames from
+    SharedFrameHub and publishes what process_frame_for_agent returns on
+    'agent:{agent_id}', where sender_stream's AgentVideoTrack picks it up.
 
-    For now we keep this very small: just the model, list of rules and
-    target FPS. This structure is designed so it can later be connected
-    to the live RTSP frames inside ``sender_stream.py``.
+    Per-camera work is shared between agents (letterbox, detections per
+    model and the BGR conversion are cached per camera frame) and the
+    pixel work runs on _PIXEL_POOL. What stays per agent is its rules,
+    pre-grouped in ``rule_plan``, and the pool of output frames it draws
+    into (``frame_pools``).
     """
 
     agent_id: str
@@ -28,6 +55,209 @@ class AgentRuntime:
     model: YOLO
     rules: List[AgentRule]
     fps: int
+    # rules grouped by target_class with their handler already resolved,
+    # see compile_rule_plan(); compiled from ``rules`` when not given
+    rule_plan: Optional[Dict[str, List[Tuple[AgentRule, Callable]]]] = None
+    # recycled output frames per pixel format, see _pooled_frame()
+    frame_pools: Dict[str, Deque[VideoFrame]] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        # Once, at build time: an empty plan (no known rule type) is a
+        # valid result, not a reason to compile again every frame
+        if self.rule_plan is None:
+            self.rule_plan = compile_rule_plan(self.rules)
+
+
+# Output frames kept per agent and format, oldest first. A frame is only
+# written again once it is neither the newest one (maybe still waiting in
+# the agent channel) nor in use by a video track (see hold_frame), so a
+# slow encoder never sees its frame change underneath it.
+_FRAME_POOL_SIZE = 3
+
+# id() of the published frames a video track has handed to its encoder
+# and not finished with yet. The track keeps the frame alive meanwhile.
+_frames_in_use: Set[int] = set()
+
+
+def hold_frame(frame: VideoFrame) -> None:
+    """Keep the agent frame pools from reusing ``frame`` until release_frame()."""
+    _frames_in_use.add(id(frame))
+
+
+def release_frame(frame: VideoFrame) -> None:
+    _frames_in_use.discard(id(frame))
+
+
+def _pooled_frame(runtime: AgentRuntime, width: int, height: int, fmt: str = "bgr24") -> VideoFrame:
+    """Return a VideoFrame of the given size and format from the agent's pool.
+
+    Reusing frames avoids a libav frame allocation (plus a full-frame copy
+    in from_ndarray) for every published frame. The oldest frame that
+    isn't held is reused; while all of them are, a new one is allocated
+    and the oldest leaves the pool (its holder still has it).
+    """
+    pool = runtime.frame_pools.setdefault(fmt, deque())
+    if pool and (pool[0].width != width or pool[0].height != height):
+        pool.clear()  # camera resolution changed
+    frame = None
+    if len(pool) >= _FRAME_POOL_SIZE:
+        for i in range(len(pool) - 1):  # never the newest
+            if id(pool[i]) not in _frames_in_use:
+                frame = pool[i]
+                del pool[i]
+                break
+        else:
+            pool.popleft()
+    if frame is None:
+        frame = VideoFrame(width, height, fmt)
+    pool.append(frame)
+    return frame
+
+
+# Plane buffer sizes of a newly allocated VideoFrame per (width, height,
+# format), i.e. the layout of every frame in the agent pools.
+_pool_layouts: Dict[Tuple[int, int, str], Tuple[int, ...]] = {}
+
+
+def _fits_pool(frame: VideoFrame) -> bool:
+    """True if ``frame`` copies plane by plane into a pooled frame (same row padding)."""
+    key = (frame.width, frame.height, frame.format.name)
+    layout = _pool_layouts.get(key)
+    if layout is None:
+        layout = _pool_layouts[key] = tuple(p.buffer_size for p in VideoFrame(*key).planes)
+    return tuple(p.buffer_size for p in frame.planes) == layout
+
+
+def _own_copy(runtime: AgentRuntime, frame: VideoFrame) -> VideoFrame:
+    """Copy a camera frame into one of the agent's own pooled frames.
+
+    Camera frames are shared with the raw stream and the other agents,
+    while whatever an agent publishes belongs to its video track alone,
+    which restamps it in place. A same-format copy is a plain plane by
+    plane memory copy; rows padded differently go through BGR instead.
+    Either way exactly one pooled frame is used.
+    """
+    fmt = frame.format.name
+    if _fits_pool(frame):
+        out = _pooled_frame(runtime, frame.width, frame.height, fmt)
+        for src, dst in zip(frame.planes, out.planes):
+            dst.update(src)
+    else:
+        # The copy path is known before a pooled frame is taken, so only
+        # the bgr24 one is used (a bgr24 source is copied row by row)
+        out = _pooled_frame(runtime, frame.width, frame.height)
+        src = _frame_pixels(frame) if fmt == "bgr24" else _frame_to_bgr(runtime.camera_id, frame)
+        np.copyto(_frame_pixels(out), src)
+    out.pts = frame.pts
+    out.time_base = frame.time_base
+    return out
+
+
+def _frame_pixels(frame: VideoFrame) -> np.ndarray:
+    """Writable (H, W, 3) view on a bgr24 frame's pixel buffer (rows may be padded)."""
+    plane = frame.planes[0]
+    return np.ndarray(
+        (frame.height, frame.width, 3),
+        dtype=np.uint8,
+        buffer=plane,
+        strides=(plane.line_size, 3, 1),
+    )
+
+
+# Detections for the latest frame per (camera_id, model). All agents on a
+# camera get the *same* frame object from SharedFrameHub, so agents that
+# also share a model (models are cached per model_id) can share one
+# forward pass instead of each running YOLO on an identical frame.
+# The cached value is the (possibly still running) detection future, so
+# agents asking while it is in flight wait for the same result.
+_shared_detections: Dict[Tuple[str, int], Tuple[VideoFrame, "asyncio.Future[List[Dict[str, Any]]]"]] = {}
+
+
+# BGR array for the latest frame per camera, only needed to draw on.
+# Converting a 1080p frame allocates and fills ~6 MB; every agent on the
+# camera needs the same pixels, so the conversion is done once and the
+# array is shared. It is marked read-only: annotation draws on a copy.
+# The array is a view on the converted frame's own (possibly row-padded)
+# buffer: to_ndarray() would copy all pixels once more into a packed array.
+_shared_bgr: Dict[str, Tuple[VideoFrame, np.ndarray]] = {}
+
+
+def _frame_to_bgr(camera_id: str, frame: VideoFrame) -> np.ndarray:
+    """Return the (shared, read-only) bgr24 array for ``frame``."""
+    cached = _shared_bgr.get(camera_id)
+    if cached is not None and cached[0] is frame:
+        return cached[1]
+    bgr_frame = frame if frame.format.name == "bgr24" else frame.reformat(format="bgr24")
+    bgr = _frame_pixels(bgr_frame)
+    bgr.flags.writeable = False
+    _shared_bgr[camera_id] = (frame, bgr)
+    return bgr
+
+
+# Letterboxed (model-sized) image for the latest frame per camera, so the
+# resize to the detection input size also happens once per frame rather
+# than inside every model call. It is made from the decoded frame
+# directly (see letterbox_frame): detection never needs the full-size BGR.
+_shared_letterbox: Dict[str, Tuple[VideoFrame, Tuple[np.ndarray, float, Tuple[int, int]]]] = {}
+
+
+def _frame_to_letterbox(camera_id: str, frame: VideoFrame):
+    """Return ``(image, ratio, pad)`` for ``frame``, shared by all agents on the camera."""
+    cached = _shared_letterbox.get(camera_id)
+    if cached is not None and cached[0] is frame:
+        return cached[1]
+    letterboxed = letterbox_frame(frame)
+    _shared_letterbox[camera_id] = (frame, letterboxed)
+    return letterboxed
+
+
+async def _detect_frame(model: YOLO, camera_id: str, frame: VideoFrame) -> List[Dict[str, Any]]:
+    # The resize runs in a worker thread: a full frame's sws pass would
+    # otherwise hold up every WebRTC track on the event loop
+    img, ratio, pad = await _in_pixel_pool(_frame_to_letterbox, camera_id, frame)
+    dets = await detect_batched(model, img)
+    return unletterbox_detections(dets, ratio, pad, (frame.height, frame.width))
+
+
+async def _detect_shared(runtime: AgentRuntime, frame: VideoFrame) -> List[Dict[str, Any]]:
+    """Run detection for ``frame`` once per model and reuse it for other agents."""
+    key = (runtime.camera_id, id(runtime.model))
+    cached = _shared_detections.get(key)
+    if cached is not None and cached[0] is frame:
+        pending = cached[1]
+    else:
+        pending = asyncio.ensure_future(_detect_frame(runtime.model, runtime.camera_id, frame))
+        _shared_detections[key] = (frame, pending)
+    # shield: one agent being stopped must not cancel the others' result
+    return await asyncio.shield(pending)
+
+
+def forget_camera(camera_id: str) -> None:
+    """Drop the per-camera caches (BGR, letterbox, detections) of ``camera_id``.
+
+    Called once the last agent on the camera has stopped, so a camera
+    nobody processes anymore doesn't keep its last frame and results.
+    """
+    _shared_bgr.pop(camera_id, None)
+    _shared_letterbox.pop(camera_id, None)
+    for key in [key for key in _shared_detections if key[0] == camera_id]:
+        del _shared_detections[key]
+
+def compile_rule_plan(rules: List[AgentRule]) -> Dict[str, List[Tuple[AgentRule, Callable]]]:
+    """Group rules by target_class and resolve each rule's handler once.
+
+    Each entry is ``(rule, handler)``. Rules with an unknown type are
+    dropped here instead of being looked up every frame.
+    """
+    plan: Dict[str, List[Tuple[AgentRule, Callable]]] = {}
+    for rule in rules:
+        handler = getattr(rules_module, rule.type, None)
+        if handler is None:
+            logger.warning("Unknown rule type: %s", rule.type)
+            continue
+        plan.setdefault(rule.target_class, []).append((rule, handler))
+    return plan
+
 
 def build_agent_runtime_from_doc(agent_doc: Dict[str, Any]) -> Optional[AgentRuntime]:
     """Build a single AgentRuntime from a MongoDB agent document.
@@ -48,7 +278,13 @@ def build_agent_runtime_from_doc(agent_doc: Dict[str, Any]) -> Optional[AgentRun
         rules.append(AgentRule.parse_obj(rd))
 
     fps = int(agent_doc.get("fps", 5))
-    return AgentRuntime(agent_id=agent_id, camera_id=camera_id, model=model, rules=rules, fps=fps)
+    return AgentRuntime(
+        agent_id=agent_id,
+        camera_id=camera_id,
+        model=model,
+        rules=rules,
+        fps=fps,
+    )
 
 
 def run_rules_for_agent(
@@ -57,56 +293,91 @@ def run_rules_for_agent(
 ) -> Tuple[bool, List[Dict[str, Any]]]:
     """Apply all rules for a single agent to a detection list.
 
-    Rule implementations live in ``rules.py``. We dynamically dispatch
-    based on ``rule.type`` so new rules can be added without changing
-    this engine module.
+    Rule implementations live in ``rules.py``. Handlers are resolved
+    from ``rule.type`` once, in compile_rule_plan(), so new rules can be
+    added without changing this engine module. Rules are grouped by
+    target_class, so each class is filtered once no matter how many
+    rules look at it.
     """
     any_match = False
     kept: List[Dict[str, Any]] = []
 
-    for rule in runtime.rules:
-        # Look up a handler function on rules_module whose name matches
-        # the rule.type value (e.g. "class_presence", "class_count").
-        handler = getattr(rules_module, rule.type, None)
-        if handler is None:
-            print("error: Unknown rule type: " + rule.type)
-            # Unknown rule type; skip silently for now.
-            continue
+    # Detections grouped by class in one pass, shared by all rules
+    by_class: Dict[Any, List[Dict[str, Any]]] = {}
+    for det in detections:
+        by_class.setdefault(det.get("class_name"), []).append(det)
 
-        matched, filtered = handler(rule, detections)
-        if matched:
-            any_match = True
-            kept.extend(filtered)
-            print(
-                f"[agent:{runtime.agent_id}] ALERT: rule '{rule.label}' matched "
-                f"for class '{rule.target_class}'"
-            )
+    for target, entries in runtime.rule_plan.items():
+        cls_dets = by_class.get(target, [])
+        for rule, handler in entries:
+            matched, filtered = handler(rule, cls_dets)
+            if matched:
+                any_match = True
+                kept.extend(filtered)
+                logger.info(
+                    "[agent:%s] ALERT: rule '%s' matched for class '%s'",
+                    runtime.agent_id, rule.label, rule.target_class,
+                )
 
     return any_match, kept
 
 
-def process_frame_for_agent(runtime: AgentRuntime, frame: VideoFrame) -> VideoFrame:
+async def process_frame_for_agent(runtime: AgentRuntime, frame: VideoFrame) -> Optional[VideoFrame]:
     """Process a single frame for exactly one agent.
 
     Unlike process_frame_for_camera (which aggregates across multiple agents),
     this function only runs detection and rules for the provided AgentRuntime.
     It annotates the frame only with detections that matched the agent's rules.
+
+    The returned frame is always the agent's own (never ``frame`` itself),
+    so its consumer may change it, e.g. restamp its pts. None when no such
+    frame could be made; nothing should be published for this frame then.
+
+    Pixel work (conversion, copy, drawing) runs in worker threads so the
+    event loop keeps serving the WebRTC tracks meanwhile.
     """
+    annotated = await _annotate_for_agent(runtime, frame)
+    if annotated is not None:
+        return annotated
     try:
-        bgr = frame.to_ndarray(format="bgr24")
+        return await _in_pixel_pool(_own_copy, runtime, frame)
     except Exception as exc:
-        print(f"[engine] Failed to convert frame for agent {runtime.agent_id}: {exc}")
-        return frame
-    if bgr is None or bgr.size == 0:
-        return frame
+        logger.warning("Failed to copy frame for agent %s: %s", runtime.agent_id, exc)
+        # ``frame`` is shared with the camera's other tracks: never hand it out
+        return None
 
-    dets = run_detection(runtime.model, bgr)
+
+async def _annotate_for_agent(runtime: AgentRuntime, frame: VideoFrame) -> Optional[VideoFrame]:
+    """Detect, apply the rules and draw; None when the frame stays as it is."""
+    if not frame.width or not frame.height:
+        return None
+
+    try:
+        dets = await _detect_shared(runtime, frame)
+    except Exception as exc:
+        logger.warning("Detection failed for agent %s: %s", runtime.agent_id, exc)
+        return None
     matched, filtered = run_rules_for_agent(runtime, dets)
     if not matched or not filtered:
-        return frame
+        return None
+    return await _in_pixel_pool(_draw_for_agent, runtime, frame, filtered)
+
+
+def _draw_for_agent(
+    runtime: AgentRuntime, frame: VideoFrame, filtered: List[Dict[str, Any]]
+) -> Optional[VideoFrame]:
+    """Draw the matched detections on a pooled copy of ``frame`` (worker thread)."""
+    # Full-size BGR only now that there is something to draw
+    try:
+        bgr = _frame_to_bgr(runtime.camera_id, frame)
+    except Exception as exc:
+        logger.warning("Failed to convert frame for agent %s: %s", runtime.agent_id, exc)
+        return None
 
-    annotated = annotate_frame_with_detections(bgr, filtered)
-    new_frame = VideoFrame.from_ndarray(annotated, format="bgr24")
+    h, w = bgr.shape[:2]
+    new_frame = _pooled_frame(runtime, w, h)
+    # Draw straight into the frame's own buffer
+    annotate_frame_with_detections(bgr, filtered, out=_frame_pixels(new_frame))
     new_frame.pts = frame.pts
     new_frame.time_base = frame.time_base
     return new_frame
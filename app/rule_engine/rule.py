@@ -8,9 +8,13 @@ If you detect a PERSON, keep it.
 If you detect a CAR, throw it away.
 """
 
+import logging
 from typing import Any, Dict, List, Tuple
+
 from app.models import AgentRule
 
+logger = logging.getLogger("vision_core.rules")
+
 
 def class_presence(
     rule: AgentRule,
@@ -43,8 +47,7 @@ def class_presence(
     # Did we find any?
     matched = len(filtered) > 0
     
-    print(f"✓ Rule '{rule.label}': Filtered {len(detections)} detections → {len(filtered)} matches")
-    print(f"✓ Rule '{rule.label}': all detected object => {detections}")
+    logger.debug("✓ Rule '%s': Filtered %d detections → %d matches", rule.label, len(detections), len(filtered))
     
     return (matched, filtered)
 
@@ -91,7 +94,7 @@ def class_count(
     # Did we meet the minimum?
     matched = count >= min_count
     
-    print(f"✓ Rule '{rule.label}': Need {min_count} {target}, found {count}")
-    print(f"✓ Rule '{rule.label}': all detected object => {detections}")
+    logger.debug("✓ Rule '%s': Need %d %s, found %d", rule.label, min_count, target, count)
     
-    return (matched, filtered)
\ No newline at end of file
+    return (matched, filtered)
+
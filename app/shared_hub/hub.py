@@ -1,77 +1,98 @@
 import asyncio
 import time
-from typing import Dict, List, Optional
+import weakref
+from collections import deque
+from typing import Deque, Dict, Optional
 
 from av import VideoFrame
 
 
+class Subscriber:
+    """
+    Receiving end of a camera channel: a bounded ring of frames plus an
+    event to wake the consumer.
+
+    Pushing is a deque append (the oldest frame falls off when full) and an
+    Event.set(), so publishing never blocks and never raises. Consumers use
+    it like the asyncio.Queue it replaces: ``frame = await sub.get()``.
+    With ``maxlen=1`` (the default) it is a "latest frame wins" slot: a
+    slow consumer always gets the newest frame and never a backlog.
+    """
+
+    def __init__(self, maxlen: int) -> None:
+        self._frames: Deque[VideoFrame] = deque(maxlen=maxlen)
+        self._event = asyncio.Event()
+
+    def put_nowait(self, frame: VideoFrame) -> None:
+        self._frames.append(frame)
+        self._event.set()
+
+    async def get(self) -> VideoFrame:
+        while not self._frames:
+            self._event.clear()
+            await self._event.wait()
+        return self._frames.popleft()
+
+    def get_nowait(self) -> VideoFrame:
+        if not self._frames:
+            raise asyncio.QueueEmpty
+        return self._frames.popleft()
+
+    def empty(self) -> bool:
+        return not self._frames
+
+    def qsize(self) -> int:
+        return len(self._frames)
+
+
 class CameraChannel:
     """
     Per-camera channel that holds the latest frame and broadcasts frames to
-    all subscribers via small asyncio queues. Slower subscribers drop old frames
-    to keep latency low.
+    all subscribers via small per-subscriber rings. Slower subscribers drop
+    old frames to keep latency low.
+
+    Subscribers are held weakly: a consumer that goes away without
+    unsubscribing is dropped from the channel automatically.
     """
 
-    def __init__(self, camera_id: str, max_sub_queue: int = 3) -> None:
+    def __init__(self, camera_id: str, max_sub_queue: int = 1) -> None:
         self.camera_id = camera_id
         self.last_frame: Optional[VideoFrame] = None
         self.last_ts: float = 0.0
-        self._subscribers: List[asyncio.Queue] = []
+        self._subscribers: "weakref.WeakSet[Subscriber]" = weakref.WeakSet()
         self._max_sub_queue = max_sub_queue
 
     def publish(self, frame: VideoFrame) -> None:
         """
         Store the latest frame and broadcast it to all current subscribers.
-        If a subscriber's queue is full, drop the oldest frame to make room.
+        If a subscriber's ring is full, its oldest frame is dropped.
         """
         self.last_frame = frame
-        self.last_ts = time.time()
+        self.last_ts = time.monotonic()
 
-        if not self._subscribers:
-            return
+        for sub in self._subscribers:
+            sub.put_nowait(frame)
 
-        dead_queues: List[asyncio.Queue] = []
-        for q in list(self._subscribers):
-            try:
-                if q.full():
-                    try:
-                        q.get_nowait()
-                    except asyncio.QueueEmpty:
-                        pass
-                q.put_nowait(frame)
-            except Exception:
-                # remove dead/broken queues
-                dead_queues.append(q)
-        if dead_queues:
-            for q in dead_queues:
-                try:
-                    self._subscribers.remove(q)
-                except ValueError:
-                    pass
-
-    def subscribe(self) -> asyncio.Queue:
+    def subscribe(self) -> Subscriber:
         """
-        Create and return a queue for receiving frames for this camera.
+        Create and return a subscriber for receiving frames for this camera.
         The latest frame (if available) is pushed immediately.
         """
-        q: asyncio.Queue = asyncio.Queue(maxsize=self._max_sub_queue)
-        self._subscribers.append(q)
+        sub = Subscriber(self._max_sub_queue)
+        self._subscribers.add(sub)
         if self.last_frame is not None:
-            try:
-                q.put_nowait(self.last_frame)
-            except asyncio.QueueFull:
-                pass
-        return q
-
-    def unsubscribe(self, q: asyncio.Queue) -> None:
-        try:
-            self._subscribers.remove(q)
-        except ValueError:
-            pass
+            sub.put_nowait(self.last_frame)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subscribers.discard(sub)
 
     def get_latest(self) -> Optional[VideoFrame]:
         return self.last_frame
 
+    def has_subscribers(self) -> bool:
+        return len(self._subscribers) > 0
+
 
 class SharedFrameHub:
     """
@@ -80,8 +101,8 @@ class SharedFrameHub:
     Usage:
         hub = SharedFrameHub.instance()
         hub.publish(camera_id, frame)
-        q = hub.subscribe(camera_id)
-        frame = await q.get()
+        sub = hub.subscribe(camera_id)
+        frame = await sub.get()
     """
 
     _instance: Optional["SharedFrameHub"] = None
@@ -105,11 +126,30 @@ class SharedFrameHub:
     def publish(self, camera_id: str, frame: VideoFrame) -> None:
         self._get_channel(camera_id).publish(frame)
 
-    def subscribe(self, camera_id: str) -> asyncio.Queue:
+    def subscribe(self, camera_id: str) -> Subscriber:
         return self._get_channel(camera_id).subscribe()
 
-    def unsubscribe(self, camera_id: str, q: asyncio.Queue) -> None:
-        self._get_channel(camera_id).unsubscribe(q)
+    def unsubscribe(self, camera_id: str, sub: Subscriber) -> None:
+        self._get_channel(camera_id).unsubscribe(sub)
 
     def get_latest(self, camera_id: str) -> Optional[VideoFrame]:
         return self._get_channel(camera_id).get_latest()
+
+    def has_subscribers(self, camera_id: str) -> bool:
+        """True if anyone subscribed to this channel (does not create it)."""
+        ch = self._channels.get(camera_id)
+        return ch is not None and ch.has_subscribers()
+
+    def close_channel(self, camera_id: str) -> None:
+        """Forget a channel so its last frame can be freed (e.g. a stopped agent).
+
+        A channel that still has subscribers is kept (minus its last frame),
+        so they receive frames again if the channel is published to later.
+        """
+        ch = self._channels.get(camera_id)
+        if ch is None:
+            return
+        if ch.has_subscribers():
+            ch.last_frame = None
+        else:
+            del self._channels[camera_id]
@@ -1,7 +1,9 @@
 # signaling_server.py
-import json
+import asyncio
 import logging
-from typing import Dict
+import os
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+import msgpack
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
@@ -9,12 +11,45 @@ import uvicorn
 # --------------------------------------------------
 # Logging
 # --------------------------------------------------
+# SIGNALING_LOG=WARNING silences the per-message INFO lines in production
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("SIGNALING_LOG", "INFO").upper(),
     format='[%(asctime)s] [SIGNALING] %(levelname)s: %(message)s'
 )
 logger = logging.getLogger("signaling")
 
+# --------------------------------------------------
+# JSON (orjson when available: several times faster on these small messages)
+# --------------------------------------------------
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # orjson is optional
+    import json
+
+    json_loads = json.loads
+
+    def json_dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+# --------------------------------------------------
+# Redis backplane (optional)
+# --------------------------------------------------
+# With REDIS_URL set, a client connected to another worker / pod is reached
+# through Redis pub/sub: every client listens on channel "sig:<client_id>".
+# Without it, everything stays in this process (single worker).
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is only needed with REDIS_URL
+    aioredis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = None  # set on startup when REDIS_URL is configured
+
 # --------------------------------------------------
 # FastAPI App
 # --------------------------------------------------
@@ -29,15 +64,291 @@ app.add_middleware(
 # --------------------------------------------------
 # Client State
 # --------------------------------------------------
+# A frame as it travels over the socket: JSON text or msgpack bytes
+Raw = Union[str, bytes]
+
+# Outgoing frames buffered per client before it counts as too slow and is
+# disconnected (WS_WRITE_LIMIT); bounds memory per stalled connection
+OUT_QUEUE_SIZE = int(os.getenv("WS_WRITE_LIMIT", "128"))
+
+# ICE candidates arrive in bursts while gathering; for clients that accept
+# "ice-batch" messages, candidates within this window go out as one frame
+ICE_BATCH_WINDOW_SEC = 0.008
+
+# WebSocket subprotocol for binary (msgpack) signaling. Same as ?codec=msgpack,
+# but negotiated in the handshake, so a client can confirm it got binary mode.
+# Binary frames also skip the UTF-8 validation every text frame goes through.
+BINARY_SUBPROTOCOL = "sig.v1.bin"
+
+
 class Client:
-    def __init__(self, client_id: str, ws: WebSocket):
+    # Fixed attribute layout: no per-connection __dict__, faster attribute
+    # access on the relay path. Every slot is set in __init__.
+    __slots__ = (
+        "id", "ws", "is_publisher", "last_offer", "last_offer_frame", "binary",
+        "out_queue", "writer_task", "close_task",
+        "ice_batch", "ice_buffer", "ice_flush", "remote_task",
+    )
+
+    def __init__(self, client_id: str, ws: WebSocket, binary: bool = False, ice_batch: bool = False):
         self.id = client_id
         self.ws = ws
         # camera OR agent are publishers
         self.is_publisher = client_id.startswith("camera") or client_id.startswith("agent")
         self.last_offer = None
+        # last offer as received (frame, decoded), replayed as-is when possible
+        self.last_offer_frame = None
+        # msgpack binary frames (?codec=msgpack) instead of JSON text frames
+        self.binary = binary
+        # Outgoing frames go through a queue drained by a writer task, so a
+        # slow client never blocks the connection that relays to it
+        self.out_queue: "asyncio.Queue[Raw]" = asyncio.Queue(maxsize=OUT_QUEUE_SIZE)
+        self.writer_task = asyncio.create_task(self._writer())
+        self.writer_task.add_done_callback(self._writer_done)
+        self.close_task: Optional[asyncio.Task] = None
+        # ?ice_batch=1: client understands {"type": "ice-batch", "candidates": [...]}
+        self.ice_batch = ice_batch
+        self.ice_buffer: List[Dict[str, Any]] = []
+        self.ice_flush: Optional[asyncio.TimerHandle] = None
+        # Frames for this client published by other workers (Redis backplane)
+        self.remote_task: Optional[asyncio.Task] = (
+            asyncio.create_task(self._remote_reader()) if redis_client is not None else None
+        )
+        if self.remote_task is not None:
+            self.remote_task.add_done_callback(self._remote_done)
+
+    async def _writer(self) -> None:
+        while True:
+            frame = await self.out_queue.get()
+            if isinstance(frame, bytes):
+                await self.ws.send_bytes(frame)
+            else:
+                await self.ws.send_text(frame)
+
+    def _writer_done(self, task: asyncio.Task) -> None:
+        """A writer that failed leaves the socket useless: close it right away."""
+        if task.cancelled():
+            return
+        exc = task.exception()
+        logger.warning("❌ Send to %s failed, disconnecting: %r", self.id, exc)
+        self._close(1011)
+
+    def _remote_done(self, task: asyncio.Task) -> None:
+        """Without its Redis reader the client misses messages from other
+        workers; close it so the peer reconnects with a fresh one."""
+        if task.cancelled():
+            return
+        exc = task.exception()
+        logger.warning("❌ Redis reader of %s stopped, disconnecting: %r", self.id, exc)
+        self._close(1011)
+
+    def _close(self, code: int) -> None:
+        if self.close_task is None:
+            self.writer_task.cancel()
+            self.close_task = asyncio.create_task(self._close_ws(code))
+
+    async def _close_ws(self, code: int) -> None:
+        try:
+            await self.ws.close(code=code)
+        except Exception as exc:  # socket already gone
+            logger.debug("Closing %s: %r", self.id, exc)
+
+    def send(self, frame: Raw) -> None:
+        """Queue ``frame`` for this client; never waits for the socket.
+
+        A client whose queue is full is not reading: it is disconnected
+        instead of holding up (or buffering without limit for) the sender.
+        """
+        try:
+            self.out_queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            if self.close_task is None:
+                logger.warning("🐢 %s is not keeping up, disconnecting", self.id)
+                self._close(1013)
 
+    async def _remote_reader(self) -> None:
+        pubsub = redis_client.pubsub()
+        await pubsub.subscribe(redis_channel(self.id))
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                raw = unpack_frame(message["data"])
+                if isinstance(raw, bytes) == self.binary:
+                    self.send(raw)
+                else:
+                    relay(self, raw, decode_message(raw))
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+
+    def queue_ice(self, msg: Dict[str, Any]) -> None:
+        """Collect an ICE message for this client; sent with the rest of its burst."""
+        self.ice_buffer.append(msg)
+        if self.ice_flush is None:
+            self.ice_flush = asyncio.get_running_loop().call_later(ICE_BATCH_WINDOW_SEC, self._flush_ice)
+
+    def _flush_ice(self) -> None:
+        self.ice_flush = None
+        candidates, self.ice_buffer = self.ice_buffer, []
+        if candidates:
+            send_message(self, {"type": "ice-batch", "candidates": candidates})
+
+    def stop(self) -> None:
+        self.writer_task.cancel()
+        if self.remote_task is not None:
+            self.remote_task.cancel()
+        if self.ice_flush is not None:
+            self.ice_flush.cancel()
+            self.ice_flush = None
+
+# All connected clients by id (relay target lookup), plus the same clients
+# split by role so role-specific lookups never scan or branch per client
 clients: Dict[str, Client] = {}
+publishers: Dict[str, Client] = {}
+viewers: Dict[str, Client] = {}
+
+
+def register(client: Client) -> None:
+    clients[client.id] = client
+    (publishers if client.is_publisher else viewers)[client.id] = client
+
+
+def unregister(client: Client) -> None:
+    for index in (clients, publishers if client.is_publisher else viewers):
+        if index.get(client.id) is client:
+            index.pop(client.id, None)
+
+# --------------------------------------------------
+# Message codecs
+# --------------------------------------------------
+# JSON text frames: browsers / legacy clients (default)
+# msgpack binary frames: smaller, and much cheaper to parse than JSON
+
+
+def decode_message(raw: Raw) -> Dict[str, Any]:
+    """Binary frames are msgpack, text frames are JSON.
+
+    The decoded message is only used to read routing fields (type / to /
+    sdp); relayed frames are forwarded as received.
+    """
+    if isinstance(raw, bytes):
+        return msgpack.unpackb(raw, raw=False)
+    return json_loads(raw)
+
+
+def send_message(client: Client, msg: Dict[str, Any]) -> None:
+    """Encode ``msg`` in the client's codec and queue it."""
+    if client.binary:
+        client.send(msgpack.packb(msg))
+    else:
+        client.send(json_dumps(msg))
+
+
+def relay(target: Client, raw: Raw, msg: Dict[str, Any]) -> None:
+    """Forward a received message to ``target``.
+
+    The server only reads routing fields, so when the target speaks the
+    sender's codec the original frame goes out untouched; only mixed
+    JSON <-> msgpack pairs are re-encoded.
+    """
+    if isinstance(raw, bytes) == target.binary:
+        target.send(raw)
+    else:
+        send_message(target, msg)
+
+
+def redis_channel(client_id: str) -> str:
+    return f"sig:{client_id}"
+
+
+def redis_offer_key(publisher_id: str) -> str:
+    """Where a publisher's last offer is kept for viewers on other workers."""
+    return f"sig:offer:{publisher_id}"
+
+
+# Removes a publisher's stored offer only if it is still the one it sent,
+# not one stored meanwhile by the same publisher reconnected elsewhere
+_DELETE_IF_SAME = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then "
+    "return redis.call('del', KEYS[1]) end return 0"
+)
+
+
+def pack_frame(raw: Raw) -> bytes:
+    """Frame -> Redis payload; a one-byte prefix keeps text vs binary apart."""
+    return b"b" + raw if isinstance(raw, bytes) else b"t" + raw.encode()
+
+
+def unpack_frame(data: bytes) -> Raw:
+    return data[1:] if data[:1] == b"b" else data[1:].decode()
+
+
+# Publishes in flight (strong references so they aren't garbage collected)
+_publish_tasks: Set[asyncio.Task] = set()
+
+
+def route(target_id: str, raw: Raw, msg: Dict[str, Any]) -> bool:
+    """Relay a frame to ``target_id`` on this worker or, via Redis, any other.
+
+    Returns False when the target is unknown (not connected here and no
+    backplane configured).
+    """
+    target = clients.get(target_id)
+    if target is not None:
+        relay(target, raw, msg)
+        return True
+    return publish_remote(target_id, raw)
+
+
+def publish_remote(target_id: str, raw: Raw) -> bool:
+    """Hand a frame to the worker ``target_id`` is connected to, via Redis."""
+    if redis_client is None:
+        return False
+    _spawn_publish(redis_client.publish(redis_channel(target_id), pack_frame(raw)))
+    return True
+
+
+def _spawn_publish(coro) -> None:
+    task = asyncio.create_task(coro)
+    _publish_tasks.add(task)
+    task.add_done_callback(_publish_tasks.discard)
+
+
+def store_offer(publisher: Client, raw: Raw) -> None:
+    """Keep ``publisher``'s offer in Redis, for late viewers on any worker."""
+    if redis_client is not None:
+        _spawn_publish(redis_client.set(redis_offer_key(publisher.id), pack_frame(raw)))
+
+
+def forget_offer(publisher: Client) -> None:
+    """Drop ``publisher``'s stored offer from Redis when it disconnects."""
+    if redis_client is not None and publisher.last_offer_frame is not None:
+        stored = pack_frame(publisher.last_offer_frame[0])
+        _spawn_publish(redis_client.eval(_DELETE_IF_SAME, 1, redis_offer_key(publisher.id), stored))
+
+
+async def find_offer(publisher_id: str) -> Optional[Tuple[Raw, Dict[str, Any]]]:
+    """Last offer of ``publisher_id`` as (frame, decoded), on this worker or via Redis."""
+    publisher = publishers.get(publisher_id)
+    if publisher is not None:
+        return publisher.last_offer_frame
+    if redis_client is None:
+        return None
+    data = await redis_client.get(redis_offer_key(publisher_id))
+    if data is None:
+        return None
+    raw = unpack_frame(data)
+    return raw, decode_message(raw)
+
+
+async def receive_raw(ws: WebSocket) -> Raw:
+    """Receive one text or binary frame, as-is."""
+    message = await ws.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    data = message.get("bytes")
+    return data if data is not None else message.get("text", "")
 
 # --------------------------------------------------
 # Helper functions
@@ -76,82 +387,167 @@ def get_publisher_id_for_viewer(viewer_id: str) -> str | None:
     return None
 
 
+# --------------------------------------------------
+# Startup / shutdown
+# --------------------------------------------------
+@app.on_event("startup")
+async def connect_backplane():
+    global redis_client
+    if not REDIS_URL:
+        return
+    if aioredis is None:
+        logger.warning("⚠️ REDIS_URL is set but the redis package is missing; running local-only")
+        return
+    redis_client = aioredis.from_url(REDIS_URL)
+    logger.info("🔗 Redis backplane enabled")
+
+
+@app.on_event("shutdown")
+async def close_backplane():
+    if redis_client is not None:
+        await redis_client.close()
+
+
+# --------------------------------------------------
+# Message handlers
+# --------------------------------------------------
+# One function per message type, looked up in HANDLERS: a single dict probe
+# per message instead of walking an if/elif chain. None of them await
+# (sending only queues), so they are plain functions.
+
+def handle_offer(client: Client, msg: Dict[str, Any], raw: Raw) -> None:
+    """OFFER (camera / agent → viewer)"""
+    if not client.is_publisher:
+        return
+    client.last_offer = msg.get("sdp")
+    client.last_offer_frame = (raw, msg)
+    store_offer(client, raw)
+    logger.info("📨 OFFER from %s", client.id)
+
+    target = msg.get("to")
+    if target and route(target, raw, msg):
+        logger.info("📤 OFFER forwarded → %s", target)
+
+
+def handle_answer(client: Client, msg: Dict[str, Any], raw: Raw) -> None:
+    """ANSWER (viewer → camera / agent)"""
+    if client.is_publisher:
+        return
+    target = msg.get("to")
+    if target and route(target, raw, msg):
+        logger.info("📤 ANSWER forwarded → %s", target)
+
+
+def handle_ice(client: Client, msg: Dict[str, Any], raw: Raw) -> None:
+    """ICE (either direction)"""
+    target = msg.get("to")
+    if not target:
+        return
+    # One lookup decides local-batched, local or remote
+    target_client = clients.get(target)
+    if target_client is None:
+        publish_remote(target, raw)
+    elif target_client.ice_batch:
+        target_client.queue_ice(msg)
+    else:
+        relay(target_client, raw, msg)
+
+
+def handle_ping(client: Client, msg: Dict[str, Any], raw: Raw) -> None:
+    """PING"""
+    send_message(client, {"type": "pong"})
+
+
+HANDLERS: Dict[str, Callable[[Client, Dict[str, Any], Raw], None]] = {
+    "offer": handle_offer,
+    "answer": handle_answer,
+    "ice": handle_ice,
+    "ping": handle_ping,
+}
+
+
 # --------------------------------------------------
 # WebSocket Endpoint
 # --------------------------------------------------
 @app.websocket("/ws/{client_id}")
-async def ws_endpoint(ws: WebSocket, client_id: str):
-    await ws.accept()
-    client = Client(client_id, ws)
-    clients[client_id] = client
+async def ws_endpoint(ws: WebSocket, client_id: str, codec: str = "json", ice_batch: int = 0):
+    binary_proto = BINARY_SUBPROTOCOL in ws.scope.get("subprotocols", [])
+    await ws.accept(subprotocol=BINARY_SUBPROTOCOL if binary_proto else None)
+    client = Client(client_id, ws, binary=(binary_proto or codec == "msgpack"), ice_batch=bool(ice_batch))
+    register(client)
 
     role = "PUBLISHER" if client.is_publisher else "VIEWER"
-    logger.info(f"✅ {role} connected: {client_id}")
+    logger.info("✅ %s connected: %s", role, client_id)
 
     # --------------------------------------------------
-    # If viewer joins late → replay last offer
+    # If viewer joins late → replay last offer (the publisher may be
+    # connected to another worker: then the offer comes from Redis)
     # --------------------------------------------------
     if not client.is_publisher:
         publisher_id = get_publisher_id_for_viewer(client_id)
-        if publisher_id and publisher_id in clients:
-            publisher = clients[publisher_id]
-            if publisher.last_offer:
-                await ws.send_text(json.dumps({
+        offer = await find_offer(publisher_id) if publisher_id else None
+        if offer is not None:
+            offer_raw, offer_msg = offer
+            if offer_msg.get("to") == client_id:
+                # The offer was addressed to this viewer: replay the original frame
+                relay(client, offer_raw, offer_msg)
+                logger.info("📤 Replayed offer %s → %s", publisher_id, client_id)
+            elif offer_msg.get("sdp"):
+                send_message(client, {
                     "type": "offer",
                     "from": publisher_id,
                     "to": client_id,
-                    "sdp": publisher.last_offer
-                }))
-                logger.info(f"📤 Replayed offer {publisher_id} → {client_id}")
+                    "sdp": offer_msg["sdp"]
+                })
+                logger.info("📤 Replayed offer %s → %s", publisher_id, client_id)
 
     try:
         while True:
-            data = await ws.receive_text()
-            msg = json.loads(data)
-
-            msg_type = msg.get("type")
-            target = msg.get("to")
-
-            # --------------------------------------------------
-            # OFFER (camera / agent → viewer)
-            # --------------------------------------------------
-            if msg_type == "offer" and client.is_publisher:
-                client.last_offer = msg.get("sdp")
-                logger.info(f"📨 OFFER from {client.id}")
-
-                if target and target in clients:
-                    await clients[target].ws.send_text(data)
-                    logger.info(f"📤 OFFER forwarded → {target}")
-
-            # --------------------------------------------------
-            # ANSWER (viewer → camera / agent)
-            # --------------------------------------------------
-            elif msg_type == "answer" and not client.is_publisher:
-                if target and target in clients:
-                    await clients[target].ws.send_text(data)
-                    logger.info(f"📤 ANSWER forwarded → {target}")
-
-            # --------------------------------------------------
-            # ICE
-            # --------------------------------------------------
-            elif msg_type == "ice":
-                if target and target in clients:
-                    await clients[target].ws.send_text(data)
-
-            # --------------------------------------------------
-            # PING
-            # --------------------------------------------------
-            elif msg_type == "ping":
-                await ws.send_text(json.dumps({"type": "pong"}))
+            data = await receive_raw(ws)
+            msg = decode_message(data)
+
+            handler = HANDLERS.get(msg.get("type"))
+            if handler is not None:
+                handler(client, msg, data)
 
     except WebSocketDisconnect:
-        logger.info(f"🔌 Disconnected: {client_id}")
+        logger.info("🔌 Disconnected: %s", client_id)
     finally:
-        clients.pop(client_id, None)
-        logger.info(f"📊 Active clients: {len(clients)}")
+        client.stop()
+        unregister(client)
+        if client.is_publisher:
+            forget_offer(client)
+        logger.info("📊 Active clients: %d (%d publishers, %d viewers)", len(clients), len(publishers), len(viewers))
 
 # --------------------------------------------------
 # Run
 # --------------------------------------------------
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools (see requirements.txt) run the socket I/O of the
+    # relay much faster than the default asyncio loop / h11 parser. uvloop
+    # isn't available on Windows; loop="auto" uses it wherever it imports.
+    # `clients` lives in each worker's own memory, so more than one worker
+    # (SIGNALING_WORKERS) needs the Redis backplane to reach clients that
+    # connected to another worker; it also holds each publisher's last
+    # offer for late viewers (see find_offer). Workers share the listening socket and
+    # the kernel spreads new connections across them.
+    workers = int(os.getenv("SIGNALING_WORKERS", "1"))
+    if workers > 1 and not REDIS_URL:
+        logger.warning("⚠️ SIGNALING_WORKERS=%d needs REDIS_URL; running 1 worker", workers)
+        workers = 1
+    # Several workers each import the app, so uvicorn needs its import path
+    if __spec__:  # python -m app.signaling_server.signaling_server
+        app_path, app_dir = f"{__spec__.name}:app", "."
+    else:  # python signaling_server.py
+        app_path, app_dir = "signaling_server:app", os.path.dirname(os.path.abspath(__file__))
+    uvicorn.run(
+        app_path,
+        app_dir=app_dir,
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="httptools",
+        ws="websockets",
+        workers=workers,
+        log_level="info",
+    )
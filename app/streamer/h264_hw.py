@@ -0,0 +1,113 @@
+"""
+HARDWARE H.264 ENCODING - LET THE VIDEO ENCODER CHIP DO THE WORK
+=================================================================
+Every decoded camera (and every agent stream) is re-encoded to H.264 by
+aiortc before it goes to the viewer. aiortc uses libx264 on the CPU for
+that, which with a few cameras becomes the biggest CPU cost of all.
+
+With VIDEO_ENCODER set to an FFmpeg hardware encoder (e.g. "h264_nvenc",
+or "h264_v4l2m2m" on boards with a V4L2 encoder), aiortc's H.264 encoder
+opens that encoder instead. Everything else stays aiortc's (RTP
+packetization, bitrate control, keyframe requests).
+
+If the hardware encoder can't be opened, libx264 is used as before.
+"""
+
+import fractions
+import logging
+import os
+from typing import Optional, Tuple
+
+import av
+from aiortc.codecs import h264
+
+logger = logging.getLogger("vision_core.pusher")
+
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER")
+
+# Low-latency settings per encoder (WebRTC: no B-frames, no lookahead)
+_ENCODER_OPTIONS = {
+    "h264_nvenc": {
+        "preset": "p1",
+        "tune": "ull",
+        "rc": "cbr",
+        "zerolatency": "1",
+        "forced-idr": "1",
+        "profile": "baseline",
+        "bf": "0",
+    },
+}
+
+# aiortc's own context factory (libx264 / h264_omx). Only some aiortc
+# releases have it; the others open libx264 inside H264Encoder._encode_frame.
+_software_encoder_context = getattr(h264, "create_encoder_context", None)
+_software_encode_frame = h264.H264Encoder._encode_frame
+_hardware_failed = False
+
+
+def _open_hardware(width: int, height: int, bitrate: int) -> Optional[av.CodecContext]:
+    """Open VIDEO_ENCODER like aiortc opens libx264; None if it can't be opened."""
+    global _hardware_failed
+    if _hardware_failed:
+        return None
+    try:
+        codec = av.CodecContext.create(VIDEO_ENCODER, "w")
+        codec.width = width
+        codec.height = height
+        codec.bit_rate = bitrate
+        codec.pix_fmt = "yuv420p"
+        codec.framerate = fractions.Fraction(h264.MAX_FRAME_RATE, 1)
+        codec.time_base = fractions.Fraction(1, h264.MAX_FRAME_RATE)
+        codec.options = dict(_ENCODER_OPTIONS.get(VIDEO_ENCODER, {}))
+        codec.open()
+        return codec
+    except Exception as exc:
+        # Don't retry on every keyframe / resolution change
+        _hardware_failed = True
+        logger.warning("⚠️ Could not open %s, encoding with libx264: %s", VIDEO_ENCODER, exc)
+        return None
+
+
+def _create_encoder_context(
+    codec_name: str, width: int, height: int, bitrate: int
+) -> Tuple[av.CodecContext, bool]:
+    """aiortc's create_encoder_context, opening VIDEO_ENCODER when it can.
+
+    Returns (codec, buffering) as aiortc's factory does; only h264_omx
+    needs aiortc to buffer packets, so hardware encoders don't.
+    """
+    codec = _open_hardware(width, height, bitrate)
+    if codec is not None:
+        return codec, False
+    return _software_encoder_context(codec_name, width, height, bitrate)
+
+
+def _encode_frame(self, frame, force_keyframe):
+    """H264Encoder._encode_frame for aiortc releases without the factory.
+
+    Opens VIDEO_ENCODER whenever aiortc would (re)create its libx264
+    context, using aiortc's own conditions; with self.codec already set,
+    aiortc's method keeps it and only encodes.
+    """
+    if self.codec and (
+        frame.width != self.codec.width
+        or frame.height != self.codec.height
+        or abs(self.target_bitrate - self.codec.bit_rate) / self.codec.bit_rate > 0.1
+    ):
+        self.buffer_data = b""
+        self.buffer_pts = None
+        self.codec = None
+    if self.codec is None:
+        self.codec = _open_hardware(frame.width, frame.height, self.target_bitrate)
+    return _software_encode_frame(self, frame, force_keyframe)
+
+
+def install() -> bool:
+    """Make aiortc encode H.264 with VIDEO_ENCODER; True if it is set."""
+    if not VIDEO_ENCODER:
+        return False
+    if _software_encoder_context is not None:
+        h264.create_encoder_context = _create_encoder_context
+    else:
+        h264.H264Encoder._encode_frame = _encode_frame
+    return True
@@ -1,20 +1,174 @@
 """
 RTSP Extraction Module - Handles RTSP camera stream extraction and frame validation.
-Uses MediaPlayer from aiortc to connect to RTSP sources.
+Uses MediaPlayer from aiortc to connect to RTSP sources, or a GStreamer
+pipeline with a hardware decoder when RTSP_GST_DECODER is set.
 """
 import asyncio
+import fractions
+import logging
+import os
+import threading
 import time
+
+import cv2
 from aiortc.contrib.media import MediaPlayer
+from aiortc.mediastreams import MediaStreamError, MediaStreamTrack
 from av import VideoFrame
 
 from app.shared_hub.hub import SharedFrameHub
-from app.db import get_agents_collection
+from app.agent_scheduler import running_agents_for_camera
+
+logger = logging.getLogger("vision_core.rtsp")
+
+# The hub is a process-wide singleton; resolve it once instead of per frame
+_HUB = SharedFrameHub.instance()
+
+# Pause before each extra frame check of a camera that gave no frame (seconds)
+_RETRY_BACKOFF_SEC = (0.1, 0.4)
+
+# Options for av.open(); PyAV hands them to the demuxer and to each
+# stream's decoder. RTSP_DECODER_THREADS (e.g. "auto") lets libavcodec
+# decode a stream on several cores, so one busy core doesn't limit it.
+_PLAYER_OPTIONS = {"rtsp_transport": "tcp", "stimeout": "5000000"}
+if os.getenv("RTSP_DECODER_THREADS"):
+    _PLAYER_OPTIONS["threads"] = os.getenv("RTSP_DECODER_THREADS")
+
+# GStreamer elements that decode H.264 to raw video, e.g. on Jetson
+# "nvv4l2decoder ! nvvidconv ! video/x-raw,format=I420". When set, decoded
+# cameras are read through GStreamer (see GstRtspPlayer) so the decoder
+# silicon does the work instead of an FFmpeg thread on the CPU.
+_GST_DECODER = os.getenv("RTSP_GST_DECODER")
+
+
+def _opencv_has_gstreamer() -> bool:
+    """True if this OpenCV build can open GStreamer pipelines.
+
+    The opencv-python wheels on PyPI are built without GStreamer; that
+    needs an OpenCV built with it (e.g. JetPack's, or from source).
+    """
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith("GStreamer:"):
+            return "YES" in line
+    return False
+
+
+if _GST_DECODER and not _opencv_has_gstreamer():
+    logger.warning(
+        "⚠️ RTSP_GST_DECODER is set but OpenCV is built without GStreamer; "
+        "decoding with MediaPlayer instead"
+    )
+    _GST_DECODER = None
 
-# Small cache to avoid pinging DB on every frame just to know if any agents
-# are running for a camera. The scheduler updates status every few seconds,
-# so a short TTL here is fine.
-_agent_presence_cache = {}
-_PRESENCE_TTL_SEC = 1.0
+_VIDEO_TIME_BASE = fractions.Fraction(1, 90000)
+
+
+def _gst_location(rtsp_url: str) -> str:
+    """Quote ``rtsp_url`` as an rtspsrc location value for gst-launch syntax.
+
+    Camera URLs come from the API, so anything that could end the value
+    and start another property or element is refused (ValueError).
+    """
+    if not rtsp_url.startswith(("rtsp://", "rtsps://")):
+        raise ValueError("not an rtsp:// URL")
+    if "!" in rtsp_url or any(ch.isspace() for ch in rtsp_url):
+        raise ValueError("URL contains whitespace or '!'")
+    escaped = rtsp_url.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class _GstVideoTrack(MediaStreamTrack):
+    """Video track of a GstRtspPlayer (like MediaPlayer's player.video)."""
+
+    kind = "video"
+
+    def __init__(self, player: "GstRtspPlayer") -> None:
+        super().__init__()
+        self._player = player
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    def _push(self, frame) -> None:
+        """Queue a frame from the reader thread (runs on the event loop)."""
+        if frame is not None:
+            # Only the newest frame is of use; anything not read yet is stale
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        self._queue.put_nowait(frame)
+
+    async def recv(self) -> VideoFrame:
+        if self.readyState != "live":
+            raise MediaStreamError
+        frame = await self._queue.get()
+        if frame is None:
+            self.stop()
+            raise MediaStreamError
+        return frame
+
+    def stop(self) -> None:
+        super().stop()
+        self._player.stop()
+
+
+class GstRtspPlayer:
+    """Stand-in for MediaPlayer that decodes an RTSP camera with GStreamer.
+
+    A reader thread pulls frames from an OpenCV GStreamer capture and
+    hands them to ``video`` on the event loop. The frames end up in system
+    memory as the ones MediaPlayer delivers: aiortc's encoder and the rule
+    engine both work on CPU frames.
+
+    They stay in the decoder's planar YUV 4:2:0 (I420), which is what the
+    H.264 encoder takes, so the live path has no colour conversion on the
+    CPU at all; only frames an agent annotates are ever turned into BGR.
+    (videoconvert passes I420 through untouched.)
+    """
+
+    def __init__(self, rtsp_url: str, decoder: str) -> None:
+        self._pipeline = (
+            f"rtspsrc location={_gst_location(rtsp_url)} protocols=tcp latency=0 ! "
+            f"rtph264depay ! h264parse ! {decoder} ! "
+            "videoconvert ! video/x-raw,format=I420 ! "
+            "appsink drop=1 max-buffers=1 sync=false"
+        )
+        self._loop = asyncio.get_running_loop()
+        self._quit = threading.Event()
+        self.audio = None
+        self.video = _GstVideoTrack(self)
+        self._thread = threading.Thread(target=self._read, name="gst-rtsp", daemon=True)
+        self._thread.start()
+
+    def _read(self) -> None:
+        capture = cv2.VideoCapture(self._pipeline, cv2.CAP_GSTREAMER)
+        try:
+            if not capture.isOpened():
+                logger.warning("⚠️ GStreamer could not open pipeline: %s", self._pipeline)
+                return
+            # Hand out the I420 planes as they are, not converted to BGR
+            capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+            # Bound once: these run for every frame of the camera
+            from_ndarray = VideoFrame.from_ndarray
+            monotonic = time.monotonic
+            call_soon_threadsafe = self._loop.call_soon_threadsafe
+            push = self.video._push
+            quit_set = self._quit.is_set
+            start = monotonic()
+            while not quit_set():
+                # I420 comes out as one (height * 3 / 2, width) plane stack
+                ok, i420 = capture.read()
+                if not ok:
+                    break
+                frame = from_ndarray(i420, format="yuv420p")
+                frame.pts = int((monotonic() - start) * 90000)
+                frame.time_base = _VIDEO_TIME_BASE
+                call_soon_threadsafe(push, frame)
+        finally:
+            capture.release()
+            try:
+                self._loop.call_soon_threadsafe(self.video._push, None)
+            except RuntimeError:
+                pass  # event loop already closed
+
+    def stop(self) -> None:
+        self._quit.set()
 
 
 async def check_player_frames(player, label, timeout=3.0):
@@ -30,30 +184,40 @@ async def check_player_frames(player, label, timeout=3.0):
         bool: True if frame was successfully received, False otherwise
     """
     if not getattr(player, "video", None):
-        print(f"[debug] {label}: No video attribute on player")
+        logger.debug("%s: No video attribute on player", label)
         return False
     try:
         frame = await asyncio.wait_for(player.video.recv(), timeout=timeout)
         if frame is None:
-            print(f"[debug] {label}: recv returned None")
+            logger.debug("%s: recv returned None", label)
             return False
-        print(f"[debug] {label}: got frame pts={getattr(frame, 'pts', '?')} size={getattr(frame,'width','?')}x{getattr(frame,'height','?')}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s: got frame pts=%s size=%sx%s", label,
+                getattr(frame, "pts", "?"), getattr(frame, "width", "?"), getattr(frame, "height", "?"),
+            )
         return True
     except asyncio.TimeoutError:
-        print(f"[debug] {label}: recv() timed out after {timeout}s")
+        logger.debug("%s: recv() timed out after %ss", label, timeout)
         return False
     except Exception as e:
-        print(f"[debug] {label}: recv() exception: {e}")
+        logger.debug("%s: recv() exception: %s", label, e)
         return False
 
 
-async def create_rtsp_player(rtsp_url, label):
+async def create_rtsp_player(rtsp_url, label, decode=True):
     """
     Create a MediaPlayer for the given RTSP URL and validate the connection.
+
+    Decoded cameras use a GstRtspPlayer instead when RTSP_GST_DECODER is set
+    (and OpenCV has GStreamer); URLs that can't go into a GStreamer
+    pipeline safely are opened with MediaPlayer.
     
     Args:
         rtsp_url: RTSP URL of the camera stream
         label: Camera label/ID for logging
+        decode: False makes player.video deliver the camera's encoded
+            packets instead of decoded frames (pass-through to WebRTC)
         
     Returns:
         tuple: (label, player, is_healthy)
@@ -62,47 +226,49 @@ async def create_rtsp_player(rtsp_url, label):
                - is_healthy: Boolean indicating if frames were successfully received
     """
     try:
-        print(f"[pusher] Creating MediaPlayer for {label}: {rtsp_url}")
-        player = MediaPlayer(
-            rtsp_url,
-            format="rtsp",
-            options={"rtsp_transport": "tcp", "stimeout": "5000000"}
-        )
-        await asyncio.sleep(0.5)  # allow ffmpeg to spin up
-        
-        ok = await check_player_frames(player, label, timeout=3.0)
-        if not ok:
-            # try one more short retry
-            print(f"[pusher] {label}: retrying frame check")
-            await asyncio.sleep(1.0)
+        player = None
+        if decode and _GST_DECODER:
+            try:
+                player = GstRtspPlayer(rtsp_url, _GST_DECODER)
+                logger.info("Created GStreamer player for %s: %s", label, rtsp_url)
+            except ValueError as e:
+                logger.warning("⚠️ %s: not using GStreamer for %s: %s", label, rtsp_url, e)
+        if player is None:
+            logger.info("Creating MediaPlayer for %s: %s", label, rtsp_url)
+            player = MediaPlayer(
+                rtsp_url,
+                format="rtsp",
+                options=dict(_PLAYER_OPTIONS),
+                decode=decode,
+            )
+        # No fixed warm-up sleep: recv() simply waits while ffmpeg spins up,
+        # so a camera that is quick to deliver is ready as soon as it does
+        ok = await check_player_frames(player, label, timeout=3.5)
+        for backoff in _RETRY_BACKOFF_SEC:
+            if ok:
+                break
+            logger.info("%s: retrying frame check", label)
+            await asyncio.sleep(backoff)
             ok = await check_player_frames(player, label, timeout=3.0)
         
         if not ok:
-            print(f"[pusher] ⚠️ {label}: no frames detected (RTSP may be wrong or camera offline)")
+            logger.warning("⚠️ %s: no frames detected (RTSP may be wrong or camera offline)", label)
         else:
-            print(f"[pusher] ✅ {label}: frames detected")
+            logger.info("✅ %s: frames detected", label)
         
         return (label, player, ok)
     except Exception as e:
-        print(f"[pusher] ❌ Error creating player for {label}: {e}")
+        logger.error("❌ Error creating player for %s: %s", label, e)
         return (label, None, False)
 
 
 def has_running_agents_for_camera(camera_id: str) -> bool:
-    """Return True if there is at least one running agent for this camera."""
-    now = time.time()
-    cached = _agent_presence_cache.get(camera_id)
-    if cached and (now - cached[0] < _PRESENCE_TTL_SEC):
-        return cached[1]
-    try:
-        coll = get_agents_collection()
-        # Quick existence check; limit=1 to keep it lightweight
-        has_any = coll.count_documents({"camera_id": camera_id, "status": "running"}, limit=1) > 0
-        _agent_presence_cache[camera_id] = (now, has_any)
-        return has_any
-    except Exception:
-        _agent_presence_cache[camera_id] = (now, False)
-        return False
+    """Return True if there is at least one running agent for this camera.
+
+    Answered from the agent scheduler's in-memory view (refreshed on every
+    status pass in this process), so no database query per call.
+    """
+    return running_agents_for_camera(camera_id)
 
 
 def fanout_frame(camera_id: str, frame: VideoFrame) -> VideoFrame:
@@ -110,18 +276,23 @@ def fanout_frame(camera_id: str, frame: VideoFrame) -> VideoFrame:
     Publish every camera frame to the shared hub so agents (when running)
     can consume the latest frames immediately. Also return the original
     frame unchanged for the live path.
+
+    Cameras nobody consumes (no running agent and no subscriber) skip the
+    hub; their channel is closed, so a consumer that comes later never
+    starts from a stale frame (and the old frame isn't kept in memory).
     """
-    try:
-        SharedFrameHub.instance().publish(camera_id, frame)
-    finally:
-        return frame
+    if running_agents_for_camera(camera_id) or _HUB.has_subscribers(camera_id):
+        _HUB.publish(camera_id, frame)
+    else:
+        _HUB.close_channel(camera_id)
+    return frame
 
 
 def subscribe_to_camera(camera_id: str):
-    """Subscribe to shared frames for a camera; returns an asyncio.Queue."""
-    return SharedFrameHub.instance().subscribe(camera_id)
+    """Subscribe to shared frames for a camera; returns a hub Subscriber (``await sub.get()``)."""
+    return _HUB.subscribe(camera_id)
 
 
 def unsubscribe_from_camera(camera_id: str, q) -> None:
-    """Unsubscribe a previously created queue from the camera channel."""
-    SharedFrameHub.instance().unsubscribe(camera_id, q)
+    """Unsubscribe a previously created subscriber from the camera channel."""
+    _HUB.unsubscribe(camera_id, q)
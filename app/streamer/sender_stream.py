@@ -3,9 +3,12 @@ WebRTC Pusher - Streams multiple RTSP cameras with YOLOv8 pose detection
 Sends video to a remote viewer via WebRTC with TURN relay support
 """
 import asyncio
-import json
+import logging
+import logging.handlers
 import os
+import queue
 import time
+import weakref
 from dotenv import load_dotenv
 from fractions import Fraction
 from aiortc import (
@@ -15,26 +18,87 @@ from aiortc import (
     RTCIceServer,
     VideoStreamTrack,
 )
-from aiortc.contrib.signaling import candidate_from_sdp
+from aiortc.rtcrtpsender import RTCRtpSender
+from aiortc.contrib.media import MediaRelay
+from aiortc.contrib.signaling import candidate_from_sdp, candidate_to_sdp
 import websockets
 
-from app.db import get_cameras_collection
-from app.db import get_agents_collection
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    # Decoded to str on purpose: the signaling server reads binary frames
+    # as msgpack, so JSON has to go out as text frames
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:  # orjson is optional; stdlib json gives the same messages
+    import json
+
+    json_loads = json.loads
+
+    def json_dumps(obj) -> str:
+        # Compact like orjson: no spaces after separators
+        return json.dumps(obj, separators=(",", ":"))
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it signaling stays JSON
+    msgpack = None
+
+from app.db import get_cameras_collection_async
+from app.db import get_agents_collection_async
 from app.streamer.rtsp_extractor import (
     create_rtsp_player,
     fanout_frame,
 )
+from app.streamer import h264_hw
 from app.shared_hub.hub import SharedFrameHub
 from app.agent_scheduler import start_agent_scheduler
+from app.rule_engine.engine import hold_frame, release_frame
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger("vision_core.pusher")
+
 # ============ Configuration from .env file ============
 SIGNALING_WS = os.getenv("SIGNALING_WS")  # WebSocket server URL for signaling
 if not SIGNALING_WS:
     raise RuntimeError("SIGNALING_WS environment variable is required for live-sender")
 
+# Send the camera's own H.264 to the viewer, without decoding and
+# re-encoding it, for cameras that have no agents (nothing needs their pixels)
+RTSP_PASSTHROUGH = os.getenv("RTSP_PASSTHROUGH", "0") == "1"
+
+# A "disconnected" peer connection often recovers by itself (ICE consent
+# checks resume after a short network drop); give it this long (seconds)
+# before the session is torn down and renegotiated
+DISCONNECT_GRACE_SEC = float(os.getenv("DISCONNECT_GRACE_SEC", "5"))
+
+# Sessions restart every few seconds while the network is flaky; the
+# camera list is reused for this long (seconds) instead of re-queried
+CAMERA_CACHE_TTL_SEC = float(os.getenv("CAMERA_CACHE_TTL_SEC", "30"))
+_camera_cache = {"ts": 0.0, "user_ids": None, "docs": None}
+
+# Decoded players outlive the session that opened them: camera_id ->
+# (rtsp_url, player). A reconnect then only renegotiates WebRTC instead of
+# redoing each camera's RTSP handshake and decoder warm-up. The relay keeps
+# reading them between sessions, so nothing queues up meanwhile.
+# Pass-through players are per session: nothing would drain their packets.
+_live_players = {}
+
+# Decoded camera tracks are read through an unbuffered relay: it keeps
+# only the newest frame, so whenever the encoder falls behind the player's
+# frames are dropped instead of queued and the viewer stays live
+_RELAY = MediaRelay()
+
+# VIDEO_ENCODER (e.g. h264_nvenc): re-encode with a hardware H.264 encoder
+HW_ENCODING = h264_hw.install()
+
+# WebSocket subprotocol the signaling server accepts for msgpack binary frames
+BINARY_SUBPROTOCOL = "sig.v1.bin"
+
 # ============ TURN Server Configuration (for NAT traversal) ============
 AWS_TURN_IP = os.getenv("AWS_TURN_IP")
 AWS_TURN_PORT = os.getenv("AWS_TURN_PORT")
@@ -60,6 +124,65 @@ if AWS_TURN_IP and AWS_TURN_PORT and AWS_TURN_USER and AWS_TURN_PASS:
         ),
     ]
 
+# The environment doesn't change between sessions: one configuration
+# (aiortc only reads it) serves every reconnect
+RTC_CONFIG = RTCConfiguration(iceServers=ICE_SERVERS)
+
+
+def decode_message(raw):
+    """Parse a signaling frame: binary frames are msgpack, text frames JSON."""
+    if isinstance(raw, bytes):
+        return msgpack.unpackb(raw, raw=False)
+    return json_loads(raw)
+
+
+def _stop_player(label, player) -> None:
+    try:
+        logger.info("Stopping player for %s", label)
+        if hasattr(player, "stop"):
+            player.stop()
+        elif getattr(player, "video", None) is not None:
+            # MediaPlayer: stopping its last track ends its demux thread
+            player.video.stop()
+    except Exception as e:
+        logger.warning("⚠️ Error stopping player for %s: %s", label, e)
+
+
+def _player_alive(player) -> bool:
+    return getattr(getattr(player, "video", None), "readyState", "ended") == "live"
+
+
+def stop_live_players() -> None:
+    """Stop the players kept across sessions (on shutdown)."""
+    for label, (_url, player) in list(_live_players.items()):
+        _stop_player(label, player)
+    _live_players.clear()
+
+
+async def load_user_cameras():
+    """Return (distinct user ids, camera docs) from MongoDB.
+
+    Camera docs are only loaded when there is exactly one user. A found
+    camera list is cached for CAMERA_CACHE_TTL_SEC; empty results are not,
+    so a camera added meanwhile is picked up by the next session.
+    """
+    now = time.monotonic()
+    if _camera_cache["docs"] is not None and now - _camera_cache["ts"] < CAMERA_CACHE_TTL_SEC:
+        return _camera_cache["user_ids"], _camera_cache["docs"]
+
+    cameras_coll = get_cameras_collection_async()
+    user_ids = await cameras_coll.distinct("user_id")
+    docs = []
+    if len(user_ids) == 1:
+        docs = await cameras_coll.find(
+            {"user_id": user_ids[0]},
+            # The session only needs these; camera docs may carry more
+            {"_id": 0, "camera_id": 1, "rtsp_url": 1},
+        ).to_list(length=None)
+    if docs:
+        _camera_cache.update(ts=now, user_ids=user_ids, docs=docs)
+    return user_ids, docs
+
 
 class ProxyVideoTrack(VideoStreamTrack):
     """Wrapper track that forwards frames from RTSP source to WebRTC.
@@ -67,11 +190,18 @@ class ProxyVideoTrack(VideoStreamTrack):
     The ``camera_id`` is used as both a human-readable label and the
     WebRTC track ID so that the viewer can map incoming tracks back to
     the correct camera.
+
+    With ``fanout=False`` the source delivers encoded packets (pass-through)
+    which are forwarded as they are and never published to the hub.
     """
-    def __init__(self, source_track, camera_id):
+    def __init__(self, source_track, camera_id, fanout=True):
         super().__init__()
         self.source = source_track
+        # Bound once; recv() runs for every frame
+        self._recv = source_track.recv
+        self._kind = getattr(source_track, "kind", "video")
         self.label = camera_id
+        self._fanout = fanout
         # Use camera_id as the ID to ensure uniqueness across tracks
         self._id = camera_id
 
@@ -83,7 +213,7 @@ class ProxyVideoTrack(VideoStreamTrack):
     @property
     def kind(self):
         """Return track kind (always 'video')"""
-        return getattr(self.source, "kind", "video")
+        return self._kind
 
     async def recv(self):
         """Receive frame from source and hand it off to the rule engine.
@@ -93,20 +223,66 @@ class ProxyVideoTrack(VideoStreamTrack):
         active agents for this camera, or no rules match, the original
         frame is returned unchanged.
         """
-        frame = await self.source.recv()
-        # Publish frame to shared hub for agents (if any are running), while
-        # continuing the normal streaming path unchanged for the caller.
-        fanout_frame(self.label, frame)
+        frame = await self._recv()
+        if self._fanout:
+            # Publish frame to shared hub for agents (if any are running), while
+            # continuing the normal streaming path unchanged for the caller.
+            fanout_frame(self.label, frame)
         # Return RAW frame to keep the main live stream unprocessed.
         return frame
 
 
+class TeeVideoTrack(VideoStreamTrack):
+    """Camera track fed by another camera's decoded frames (same RTSP URL).
+
+    Two camera entries pointing at the same stream share one MediaPlayer:
+    this track takes the frames the owner camera's track publishes to
+    SharedFrameHub, instead of opening and decoding the stream a second
+    time. Like ProxyVideoTrack it uses ``camera_id`` as its track ID and
+    fans its frames out under that ID for the camera's own agents.
+    """
+    def __init__(self, source_camera_id: str, camera_id: str) -> None:
+        super().__init__()
+        self.label = camera_id
+        self._id = camera_id
+        self._source_id = source_camera_id
+        self._hub = SharedFrameHub.instance()
+        # Latest-frame slot: a slow encoder skips frames instead of lagging
+        self._sub = self._hub.subscribe(source_camera_id)
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    @property
+    def kind(self) -> str:
+        return "video"
+
+    def stop(self) -> None:
+        self._hub.unsubscribe(self._source_id, self._sub)
+        super().stop()
+
+    async def recv(self):
+        frame = await self._sub.get()
+        fanout_frame(self.label, frame)
+        return frame
+
+
+# The one live AgentVideoTrack per agent. Its recv() restamps the agent's
+# frames in place, so two tracks on the same channel would overwrite each
+# other's pts; a new track for an agent stops the previous one.
+_agent_tracks: "weakref.WeakValueDictionary[str, AgentVideoTrack]" = weakref.WeakValueDictionary()
+
+
 class AgentVideoTrack(VideoStreamTrack):
     """Video track that outputs processed frames for a specific agent.
 
     Frames are pulled from SharedFrameHub channel 'agent:{agent_id}'. The
     track ID is set to '<camera_id>-<agent_id>' to keep it unique and
     discoverable by the viewer.
+
+    Only the newest track of an agent is subscribed to its channel (see
+    _agent_tracks): creating one stops the agent's previous track.
     """
     def __init__(self, camera_id: str, agent_id: str) -> None:
         super().__init__()
@@ -116,12 +292,19 @@ class AgentVideoTrack(VideoStreamTrack):
         self.label = self._id
         self._label = f"agent:{agent_id}"
         self._hub = SharedFrameHub.instance()
-        # Track the last source pts we saw to avoid emitting duplicates
-        self._last_src_pts = None
+        previous = _agent_tracks.get(agent_id)
+        if previous is not None:
+            previous.stop()
+        _agent_tracks[agent_id] = self
+        # Woken by every frame published to 'agent:{agent_id}' (no polling)
+        self._sub = self._hub.subscribe(self._label)
         # Output timestamp base and origin for monotonically increasing pts
         self._time_base = Fraction(1, 1000)  # milliseconds
-        self._t0 = None  # wall-clock origin for this track
-        self._last_out_pts = None
+        self._t0 = None  # monotonic clock origin for this track (ms)
+        self._last_out_pts = -1
+        # Frame last returned by recv(): the sender encodes it before it
+        # asks for the next one, so it stays held until then
+        self._in_flight = None
 
     @property
     def id(self) -> str:
@@ -131,126 +314,217 @@ class AgentVideoTrack(VideoStreamTrack):
     def kind(self) -> str:
         return "video"
 
+    def stop(self) -> None:
+        self._hub.unsubscribe(self._label, self._sub)
+        if _agent_tracks.get(self.agent_id) is self:
+            del _agent_tracks[self.agent_id]
+        self._release_in_flight()
+        super().stop()
+
+    def _release_in_flight(self) -> None:
+        if self._in_flight is not None:
+            release_frame(self._in_flight)
+            self._in_flight = None
+
     async def recv(self):
         """Return the next processed frame for this agent.
 
-        Pulls the latest processed frame from SharedFrameHub and re-stamps
+        Waits for the next processed frame published to SharedFrameHub and re-stamps
         it with a monotonically increasing pts/time_base to satisfy the
         encoder even if the source pts resets or is non-monotonic.
-        """
-        channel = self._label  # 'agent:<agent_id>'
-        while True:
-            frame = self._hub.get_latest(channel)
-            if frame is None:
-                await asyncio.sleep(0.01)
-                continue
-
-            src_pts = getattr(frame, "pts", None)
-            if self._last_src_pts is not None and src_pts == self._last_src_pts:
-                await asyncio.sleep(0.005)
-                continue
-            self._last_src_pts = src_pts
 
-            # Build a safe, monotonic timestamp in milliseconds
-            now_ms = int(time.time() * 1000)
-            if self._t0 is None:
-                self._t0 = now_ms
-            out_pts = max(0, now_ms - self._t0)
-            if self._last_out_pts is not None and out_pts <= self._last_out_pts:
-                out_pts = self._last_out_pts + 1
-            self._last_out_pts = out_pts
+        Frames on an agent channel are the agent's own (see
+        process_frame_for_agent) and this track is the channel's only
+        subscriber (see _agent_tracks), so they are restamped in place,
+        no copy.
 
-            try:
-                # Create a fresh frame to avoid mutating shared object
-                nd = frame.to_ndarray(format="bgr24")
-                new_frame = type(frame).from_ndarray(nd, format="bgr24")
-            except Exception:
-                # As a fallback, return the original frame
-                new_frame = frame
+        Every frame that arrives is new: the agent publishes each camera
+        frame at most once, and the subscriber's slot hands each publish
+        out once. Two frames that carry the same source pts (which FFmpeg
+        can produce) are still two frames, so no pts-based dedup.
 
-            new_frame.pts = out_pts
-            new_frame.time_base = self._time_base
-            return new_frame
+        The returned frame is held (see hold_frame) until the next call,
+        so the agent's frame pool doesn't write over it mid-encode.
+        """
+        self._release_in_flight()
+        frame = await self._sub.get()
+        hold_frame(frame)
+        self._in_flight = frame
+
+        # Build a safe, monotonic timestamp in milliseconds (integer
+        # clock: no float math, and immune to wall-clock jumps, so it
+        # never goes below the origin)
+        now_ms = time.monotonic_ns() // 1_000_000
+        if self._t0 is None:
+            self._t0 = now_ms
+        out_pts = now_ms - self._t0
+        # Two frames within the same millisecond would share a pts,
+        # which the encoder rejects. Monotonic doesn't mean strictly
+        # increasing, so this check stays.
+        if out_pts <= self._last_out_pts:
+            out_pts = self._last_out_pts + 1
+        self._last_out_pts = out_pts
+
+        frame.pts = out_pts
+        frame.time_base = self._time_base
+        return frame
 
 
 async def run_single_session():
-    pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=ICE_SERVERS))
-    print(f"[pusher] PeerConnection created. TURN: {AWS_TURN_IP}:{AWS_TURN_PORT if AWS_TURN_IP else ''}")
+    pc = RTCPeerConnection(configuration=RTC_CONFIG)
+    logger.info("PeerConnection created. TURN: %s:%s", AWS_TURN_IP, AWS_TURN_PORT if AWS_TURN_IP else "")
+
+    # Set once the peer connection is lost; the keep-alive loop waits on it
+    pc_down = asyncio.Event()
+
+    def down_if_still_disconnected():
+        if pc.connectionState == "disconnected":
+            pc_down.set()
 
     @pc.on("connectionstatechange")
     def on_conn_state():
-        print("[pusher] Connection state:", pc.connectionState)
+        logger.info("Connection state: %s", pc.connectionState)
+        if pc.connectionState in ("failed", "closed"):
+            pc_down.set()
+        elif pc.connectionState == "disconnected":
+            # A timer, not a wait loop: nothing runs unless it doesn't recover
+            asyncio.get_running_loop().call_later(DISCONNECT_GRACE_SEC, down_if_still_disconnected)
         if pc.connectionState == "failed":
-            print("[pusher] ⚠️ Connection failed, will attempt to recover")
+            logger.warning("⚠️ Connection failed, will attempt to recover")
         elif pc.connectionState == "disconnected":
-            print("[pusher] ⚠️ Connection disconnected, waiting for reconnection")
+            logger.warning("⚠️ Connection disconnected, waiting for reconnection")
 
-    players = []
+    players = []  # pass-through players, stopped with the session
+    relayed_tracks = []  # this session's relay subscriptions
+    agent_tracks = []  # this session's agent tracks
 
-    cameras_coll = get_cameras_collection()
-    distinct_user_ids = cameras_coll.distinct("user_id")
+    # Async (motor) lookups: a slow MongoDB must not stall the event loop,
+    # which keeps streaming agent frames between sessions
+    distinct_user_ids, camera_docs = await load_user_cameras()
     if not distinct_user_ids:
-        print("[pusher] ❌ No users/cameras found in database. Please add a camera first.")
+        logger.error("❌ No users/cameras found in database. Please add a camera first.")
         await pc.close()
         return
 
     if len(distinct_user_ids) > 1:
-        print(f"[pusher] ❌ Multiple user_ids found in database: {distinct_user_ids}. This Jetson instance is expected to serve exactly one user.")
+        logger.error(
+            "❌ Multiple user_ids found in database: %s. This Jetson instance is expected to serve exactly one user.",
+            distinct_user_ids,
+        )
         await pc.close()
         return
 
     user_id = distinct_user_ids[0]
-    print(f"[pusher] Resolved user_id from MongoDB: {user_id}")
+    logger.info("Resolved user_id from MongoDB: %s", user_id)
 
-    camera_docs = list(cameras_coll.find({"user_id": user_id}))
     if not camera_docs:
-        print(f"[pusher] ❌ No cameras found for user_id={user_id}")
+        logger.error("❌ No cameras found for user_id=%s", user_id)
         await pc.close()
         return
 
+    # Agents of this user's cameras (any status) are needed twice: to know
+    # which cameras may skip decoding, and for the agent tracks below
+    camera_ids = [c.get("camera_id") for c in camera_docs if c.get("camera_id")]
+    try:
+        agents_coll = get_agents_collection_async()
+        running_agents = await agents_coll.find(
+            {"camera_id": {"$in": camera_ids}},
+            {"_id": 0, "agent_id": 1, "camera_id": 1},
+        ).to_list(length=None)
+    except Exception as e:
+        logger.warning("⚠️ Failed to load agents: %s", e)
+        running_agents = []
+    agent_cameras = {a.get("camera_id") for a in running_agents}
+    # Cameras whose player also feeds other cameras with the same URL
+    tee_sources = set()
+
+    def passthrough(camera_id):
+        return RTSP_PASSTHROUGH and camera_id not in agent_cameras and camera_id not in tee_sources
+
     async def create_player(rtsp_url, label):
-        result = await create_rtsp_player(rtsp_url, label)
+        decode = not passthrough(label)
+        kept = _live_players.pop(label, None)
+        if kept is not None:
+            if decode and kept[0] == rtsp_url and _player_alive(kept[1]):
+                _live_players[label] = kept
+                logger.info("%s: reusing the player of the previous session", label)
+                return (label, kept[1], True)
+            _stop_player(label, kept[1])
+        result = await create_rtsp_player(rtsp_url, label, decode=decode)
         label, player, ok = result
         if player is not None:
-            players.append((label, player))
+            if decode:
+                _live_players[label] = (rtsp_url, player)
+            else:
+                players.append((label, player))
         return result
 
-    # create players for each camera of this user
-    player_infos = []
+    # create players for each camera of this user, all cameras in parallel
+    # (each one waits for its first frame; no need to wait camera by camera).
+    # A URL is opened and decoded once; later cameras with the same URL tee
+    # off the first one's frames.
+    player_jobs = []
+    url_owner = {}
+    teed = []  # (camera_id, camera_id of the player it shares)
     for cam in camera_docs:
         camera_id = cam.get("camera_id")
         rtsp_url = cam.get("rtsp_url")
         if not camera_id or not rtsp_url:
-            print(f"[pusher] ⚠️ Skipping camera with missing data: {cam}")
+            logger.warning("⚠️ Skipping camera with missing data: %s", cam)
+            continue
+        owner = url_owner.setdefault(rtsp_url, camera_id)
+        if owner != camera_id:
+            teed.append((camera_id, owner))
+            tee_sources.add(owner)
+            continue
+        player_jobs.append(create_player(rtsp_url, camera_id))
+    # Players of cameras this session doesn't open (removed, or now teed)
+    for label in _live_players.keys() - url_owner.values():
+        _stop_player(label, _live_players.pop(label)[1])
+    # An unexpected error from one camera must not abort the others (their
+    # players would still be opened, but never added or stopped)
+    player_infos = []
+    for info in await asyncio.gather(*player_jobs, return_exceptions=True):
+        if isinstance(info, BaseException):
+            logger.error("❌ Error creating player: %s", info)
             continue
-        info = await create_player(rtsp_url, camera_id)
         player_infos.append(info)
 
     # If no players, exit
     active_infos = [info for info in player_infos if info[1] is not None]
     if not active_infos:
-        print("[pusher] ❌ No players created, exiting")
+        logger.error("❌ No players created, exiting")
         await pc.close()
         return
 
     # Add one video track per camera (RAW streams)
+    h264 = [c for c in RTCRtpSender.getCapabilities("video").codecs if c.mimeType == "video/H264"]
     for label, player, _ok in active_infos:
         if player is None:
             continue
-        proxied = ProxyVideoTrack(player.video, label)
-        pc.addTrack(proxied)
-    print(f"[pusher] Added {len(active_infos)} camera track(s)")
+        if passthrough(label):
+            sender = pc.addTrack(ProxyVideoTrack(player.video, label, fanout=False))
+            # Packets can only be forwarded if H.264 is what gets negotiated
+            transceiver = next(t for t in pc.getTransceivers() if t.sender == sender)
+            transceiver.setCodecPreferences(h264)
+            logger.info("%s: H.264 pass-through (no decode/re-encode)", label)
+            continue
+        # Encoded packets (pass-through, above) must all be sent; decoded
+        # frames can be skipped, so only those go through the relay
+        relayed = _RELAY.subscribe(player.video, buffered=False)
+        relayed_tracks.append(relayed)
+        pc.addTrack(ProxyVideoTrack(relayed, label))
+    active_labels = {label for label, _player, _ok in active_infos}
+    for camera_id, owner in teed:
+        if owner in active_labels:
+            pc.addTrack(TeeVideoTrack(owner, camera_id))
+            logger.info("%s: sharing the stream of %s", camera_id, owner)
+    logger.info("Added %d camera track(s)", len(active_infos))
 
     # Add a video track for each agent (processed streams). We do not filter by status
     # so that viewers can connect before an agent transitions to 'running'. Tracks will
     # start producing frames once available.
     try:
-        camera_ids = [c.get("camera_id") for c in camera_docs if c.get("camera_id")]
-        agents_coll = get_agents_collection()
-        running_agents = list(agents_coll.find({
-            "camera_id": {"$in": camera_ids},
-        }))
-
         added_agents = 0
         for agent_doc in running_agents:
             agent_id = agent_doc.get("agent_id")
@@ -258,107 +532,155 @@ async def run_single_session():
             if not agent_id or not camera_id:
                 continue
             track = AgentVideoTrack(camera_id=camera_id, agent_id=agent_id)
+            agent_tracks.append(track)
             pc.addTrack(track)
             added_agents += 1
-        print(f"[pusher] Added {added_agents} agent track(s)")
+        logger.info("Added %d agent track(s)", added_agents)
     except Exception as e:
-        print(f"[pusher] ⚠️ Failed to add agent tracks: {e}")
+        logger.warning("⚠️ Failed to add agent tracks: %s", e)
+
+    if HW_ENCODING:
+        # The hardware encoder only helps if the viewer picks H.264, not VP8
+        for transceiver in pc.getTransceivers():
+            transceiver.setCodecPreferences(h264)
 
     camera_client_id = f"camera:{user_id}"
     viewer_client_id = f"viewer:{user_id}"
 
     # Connect signaling
-    ws_url = SIGNALING_WS.rstrip("/") + "/" + camera_client_id
-    print("[pusher] Connecting to signaling server:", ws_url)
+    # ice_batch=1: the server may coalesce bursts of ICE candidates into
+    # one "ice-batch" message (handled below)
+    ws_url = SIGNALING_WS.rstrip("/") + "/" + camera_client_id + "?ice_batch=1"
+    logger.info("Connecting to signaling server: %s", ws_url)
 
     try:
-        async with websockets.connect(ws_url, ping_interval=20, ping_timeout=10, close_timeout=5) as ws:
-            print("[pusher] ✅ Signaling connected")
-
+        subprotocols = [BINARY_SUBPROTOCOL] if msgpack is not None else None
+        # No permessage-deflate: zlib costs more CPU than it saves bytes on
+        # messages this small. max_size/max_queue bound what a misbehaving
+        # peer can make us buffer (an SDP answer is a few KB).
+        async with websockets.connect(
+            ws_url,
+            subprotocols=subprotocols,
+            compression=None,
+            max_size=2**20,
+            max_queue=32,
+            ping_interval=20,
+            ping_timeout=10,
+            close_timeout=5,
+        ) as ws:
+            # Binary (msgpack) frames only if the server confirmed them in
+            # the handshake; a server that doesn't know the subprotocol
+            # keeps talking JSON text frames
+            binary = ws.subprotocol == BINARY_SUBPROTOCOL
+            encode = msgpack.packb if binary else json_dumps
+            logger.info("✅ Signaling connected (%s)", "msgpack" if binary else "JSON")
+
+            # ICE message template for this session: only the candidate
+            # fields change per message. It is filled and encoded with no
+            # await in between, so concurrent handlers can share it.
+            ice_candidate = {"candidate": "", "sdpMid": None, "sdpMLineIndex": None}
+            ice_msg = {"type":"ice","from":camera_client_id,"to":viewer_client_id,"candidate":ice_candidate}
+            # End of candidates: an empty candidate, sent once
+            ice_end = {"type":"ice","from":camera_client_id,"to":viewer_client_id,"candidate":{}}
+
+            # aiortc gathers all local candidates inside setLocalDescription()
+            # and puts them in the offer SDP, so it doesn't trickle them (no
+            # "icecandidate" events today) and there is no burst to batch into
+            # one send. The handler is kept for aiortc versions that do.
             @pc.on("icecandidate")
             async def on_local_ice(candidate):
                 try:
                     if candidate is None:
-                        await ws.send(json.dumps({"type":"ice","from":camera_client_id,"to":viewer_client_id,"candidate":{}}))
+                        await ws.send(encode(ice_end))
                         return
-                    msg = {
-                        "type":"ice",
-                        "from": camera_client_id,
-                        "to": viewer_client_id,
-                        "candidate": {
-                            "candidate": candidate.to_sdp(),
-                            "sdpMid": candidate.sdpMid,
-                            "sdpMLineIndex": candidate.sdpMLineIndex
-                        }
-                    }
-                    await ws.send(json.dumps(msg))
+                    # Serialized once per candidate (aiortc candidates have
+                    # no to_sdp() method; this is the contrib helper)
+                    ice_candidate["candidate"] = candidate_to_sdp(candidate)
+                    ice_candidate["sdpMid"] = candidate.sdpMid
+                    ice_candidate["sdpMLineIndex"] = candidate.sdpMLineIndex
+                    await ws.send(encode(ice_msg))
                 except Exception as e:
-                    print("[pusher] ❌ Error sending ICE candidate:", e)
+                    logger.error("❌ Error sending ICE candidate: %s", e)
 
-            # create offer
-            print("[pusher] Creating SDP offer...")
+            # create offer. It can't be cached across sessions: every peer
+            # connection has its own ICE ufrag/password, DTLS fingerprint
+            # and SSRCs, and aiortc only accepts a local description that
+            # matches its own transports. Building it is cheap next to ICE.
+            logger.info("Creating SDP offer...")
             offer = await pc.createOffer()
             await pc.setLocalDescription(offer)
 
-            # send offer
-            offer_msg = {"type":"offer","from": camera_client_id, "to": viewer_client_id, "sdp": pc.localDescription.sdp}
-            await ws.send(json.dumps(offer_msg))
-            print("[pusher] ✅ Offer sent to viewer")
+            # send offer. Not before setLocalDescription() has returned: that
+            # is where aiortc gathers the ICE candidates, and they reach the
+            # viewer only inside this SDP (aiortc doesn't trickle them). The
+            # createOffer() SDP has none, so sending it early would leave
+            # the viewer without a single candidate to connect to.
+            # pc.localDescription re-serializes the whole SDP on every
+            # access, so it is read once.
+            local_sdp = pc.localDescription.sdp
+            offer_msg = {"type":"offer","from": camera_client_id, "to": viewer_client_id, "sdp": local_sdp}
+            await ws.send(encode(offer_msg))
+            logger.info("✅ Offer sent to viewer")
 
             # Keep track of connection state
             keepalive_task = None
 
             async def keepalive_loop():
-                """Send fall alerts and pings while connection is active.
+                """Watch the peer connection while the session is active.
 
-                If the peer connection enters a failed/closed state, proactively
+                If the peer connection enters a failed/closed state (or stays
+                disconnected for DISCONNECT_GRACE_SEC), proactively
                 close the signaling WebSocket so the current session can end and
                 a fresh one can be created by run_forever().
+
+                The signaling connection itself is kept alive by the websockets
+                protocol pings (ping_interval/ping_timeout above), so no
+                application-level ping messages are sent.
+
+                Nothing is polled: the loop sleeps until the connection state
+                handler reports the peer connection as lost.
                 """
-                print("[pusher] Keep-alive loop started")
-                last_heartbeat = time.time()
+                logger.debug("Keep-alive loop started")
                 try:
-                    while not ws.closed:
-                        await asyncio.sleep(1)
-                        current_time = time.time()
-
-                        # Monitor peer connection state
-                        if pc.connectionState in ["failed", "closed", "disconnected"]:
-                            print("[pusher] ⚠️ Peer connection state is", pc.connectionState,
-                                  "- closing signaling WebSocket to restart session")
-                            try:
-                                await ws.close()
-                            except Exception as e:
-                                print(f"[pusher] ⚠️ Error closing WebSocket after PC failure: {e}")
-                            break
-
-                        # Send keep-alive ping every 10 seconds to maintain signaling connection
-                        if current_time - last_heartbeat > 10:
-                            try:
-                                if ws and not ws.closed:
-                                    await ws.send(json.dumps({
-                                        "type": "ping",
-                                        "from": camera_client_id,
-                                        "to": viewer_client_id
-                                    }))
-                                    last_heartbeat = current_time
-                            except Exception as e:
-                                print(f"[pusher] Keep-alive ping failed: {e}")
-                                break
+                    await pc_down.wait()
+                    logger.warning(
+                        "⚠️ Peer connection state is %s - closing signaling WebSocket to restart session",
+                        pc.connectionState,
+                    )
+                    try:
+                        await ws.close()
+                    except Exception as e:
+                        logger.warning("⚠️ Error closing WebSocket after PC failure: %s", e)
                 except asyncio.CancelledError:
-                    print("[pusher] Keep-alive loop cancelled")
+                    logger.debug("Keep-alive loop cancelled")
                     raise
                 except Exception as e:
-                    print(f"[pusher] Keep-alive loop error: {e}")
+                    logger.warning("Keep-alive loop error: %s", e)
+
+            async def add_remote_ice(message):
+                try:
+                    candidate_data = message.get("candidate") or {}
+                    candidate_str = candidate_data.get("candidate")
+                    if not candidate_str:
+                        await pc.addIceCandidate(None)
+                        logger.debug("✅ Remote ICE end (added None)")
+                        return
+                    candidate = candidate_from_sdp(candidate_str)
+                    candidate.sdpMid = candidate_data.get("sdpMid")
+                    candidate.sdpMLineIndex = candidate_data.get("sdpMLineIndex")
+                    await pc.addIceCandidate(candidate)
+                    logger.debug("Added remote ICE candidate")
+                except Exception as e:
+                    logger.warning("⚠️ Failed to add remote ICE: %s", e)
 
             # handle incoming messages with separate keep-alive task
             try:
                 keepalive_task = asyncio.create_task(keepalive_loop())
                 async for raw in ws:
                     try:
-                        message = json.loads(raw)
+                        message = decode_message(raw)
                     except Exception as e:
-                        print("[pusher] ⚠️ Invalid JSON:", e)
+                        logger.warning("⚠️ Invalid signaling message: %s", e)
                         continue
 
                     typ = message.get("type")
@@ -366,28 +688,18 @@ async def run_single_session():
                         try:
                             answer = RTCSessionDescription(sdp=message["sdp"], type="answer")
                             await pc.setRemoteDescription(answer)
-                            print("[pusher] ✅ Remote description set")
+                            logger.info("✅ Remote description set")
                         except Exception as e:
-                            print("[pusher] ❌ setRemoteDescription failed:", e)
+                            logger.error("❌ setRemoteDescription failed: %s", e)
                     elif typ == "ice":
-                        try:
-                            candidate_data = message.get("candidate") or {}
-                            candidate_str = candidate_data.get("candidate")
-                            if not candidate_str:
-                                await pc.addIceCandidate(None)
-                                print("[pusher] ✅ Remote ICE end (added None)")
-                                continue
-                            candidate = candidate_from_sdp(candidate_str)
-                            candidate.sdpMid = candidate_data.get("sdpMid")
-                            candidate.sdpMLineIndex = candidate_data.get("sdpMLineIndex")
-                            await pc.addIceCandidate(candidate)
-                            print("[pusher] Added remote ICE candidate")
-                        except Exception as e:
-                            print("[pusher] ⚠️ Failed to add remote ICE:", e)
+                        await add_remote_ice(message)
+                    elif typ == "ice-batch":
+                        for ice_message in message.get("candidates") or []:
+                            await add_remote_ice(ice_message)
                     else:
-                        print("[pusher] ⚠️ Unknown message type:", typ)
+                        logger.warning("⚠️ Unknown message type: %s", typ)
             except asyncio.CancelledError:
-                print("[pusher] Message handling cancelled")
+                logger.info("Message handling cancelled")
                 raise
             finally:
                 if keepalive_task is not None:
@@ -396,20 +708,20 @@ async def run_single_session():
                         await keepalive_task
                     except asyncio.CancelledError:
                         pass
-                print("[pusher] Message loop finished, ending session")
+                logger.info("Message loop finished, ending session")
 
     except Exception as e:
-        print("[pusher] ❌ Signaling/WS exception:", e)
+        logger.error("❌ Signaling/WS exception: %s", e)
     finally:
         for label, player in players:
-            try:
-                if player is not None:
-                    print(f"[pusher] Stopping player for {label}")
-                    if hasattr(player, "stop"):
-                        player.stop()
-            except Exception as e:
-                print(f"[pusher] ⚠️ Error stopping player for {label}: {e}")
-        print("[pusher] Closing peer connection")
+            _stop_player(label, player)
+        # Unsubscribe from the relay; the decoded players themselves stay
+        for track in relayed_tracks:
+            track.stop()
+        # pc.close() stops the senders but not their tracks
+        for track in agent_tracks:
+            track.stop()
+        logger.info("Closing peer connection")
         await pc.close()
 
 
@@ -419,31 +731,63 @@ async def run_forever(retry_delay: float = 3.0):
     try:
         await start_agent_scheduler()
     except Exception as e:
-        print(f"[pusher] ⚠️ Failed to start agent scheduler in sender process: {e}")
+        logger.warning("⚠️ Failed to start agent scheduler in sender process: %s", e)
 
-    while True:
-        print("[pusher] === Starting new WebRTC session ===")
-        try:
-            await run_single_session()
-        except asyncio.CancelledError:
-            print("[pusher] Streaming loop cancelled, shutting down")
-            raise
-        except Exception as e:
-            print(f"[pusher] ❌ Unexpected error in WebRTC session: {e}")
-        print(f"[pusher] Session ended, restarting in {retry_delay} seconds...")
-        await asyncio.sleep(retry_delay)
+    try:
+        while True:
+            logger.info("=== Starting new WebRTC session ===")
+            try:
+                await run_single_session()
+            except asyncio.CancelledError:
+                logger.info("Streaming loop cancelled, shutting down")
+                raise
+            except Exception as e:
+                logger.error("❌ Unexpected error in WebRTC session: %s", e)
+            logger.info("Session ended, restarting in %s seconds...", retry_delay)
+            await asyncio.sleep(retry_delay)
+    finally:
+        stop_live_players()
 
 
 if __name__ == "__main__":
+    # Detector / engine / rule logs ("vision_core.*"); per-frame details are
+    # DEBUG, so the default WARNING keeps the frame loop quiet
+    logging.basicConfig(
+        level=os.getenv("VISION_LOG", "WARNING").upper(),
+        format='[%(asctime)s] [%(name)s] %(levelname)s: %(message)s'
+    )
+    # Session progress and agent scheduling are INFO (PUSHER_LOG=WARNING
+    # to silence them)
+    logger.setLevel(os.getenv("PUSHER_LOG", "INFO").upper())
+    logging.getLogger("vision_core.scheduler").setLevel(os.getenv("PUSHER_LOG", "INFO").upper())
+    # Records are only queued on the event loop; formatting and writing
+    # them happens on the listener's thread, so slow stderr never stalls it
+    root = logging.getLogger()
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
     print("="*60)
     print("WebRTC Multi-Camera Pusher with YOLOv8 Pose Detection")
     print("User ID: will be resolved dynamically from MongoDB")
     print(f"Signaling URL: {SIGNALING_WS}")
+    print(f"H.264 encoder: {h264_hw.VIDEO_ENCODER or 'libx264'}")
     print("="*60)
+    # uvloop (see requirements.txt) schedules callbacks, timers and the
+    # RTP/ICE socket I/O faster than the default loop; it isn't available
+    # on Windows, which keeps the default loop
+    try:
+        import uvloop
+
+        uvloop.install()
+    except ImportError:
+        pass
     try:
         asyncio.run(run_forever())
     except KeyboardInterrupt:
-        print("\n[pusher] Stopped by user")
+        logger.info("Stopped by user")
     except Exception as e:
-        print("[pusher] Fatal:", e)
+        logger.critical("Fatal: %s", e)
+    finally:
+        listener.stop()  # flush what is still queued
 
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import ValidationError
+
+from app.api import cameras
+
+
+class FakeCursor(list):
+    def sort(self, key):
+        return FakeCursor(sorted(self, key=lambda doc: doc[key]))
+
+
+class FakeCameras:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor(doc for doc in self.docs if doc["user_id"] == query["user_id"])
+
+
+CAMERA = {
+    "user_id": "u1",
+    "camera_id": "cam1",
+    "camera_name": "door",
+    "rtsp_url": "rtsp://cam/1",
+    "device_id": None,
+    "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc),
+}
+
+
+def test_list_cameras_returns_only_cameraout_fields(monkeypatch):
+    monkeypatch.setattr(cameras, "get_cameras_collection", lambda: FakeCameras([dict(CAMERA, internal_note="secret")]))
+
+    (camera,) = cameras.list_cameras("u1")
+
+    assert isinstance(camera, cameras.CameraOut)
+    assert "internal_note" not in camera.model_dump()
+    assert camera.camera_id == "cam1"
+
+
+def test_list_cameras_rejects_documents_missing_fields(monkeypatch):
+    broken = {k: v for k, v in CAMERA.items() if k != "created_at"}
+    monkeypatch.setattr(cameras, "get_cameras_collection", lambda: FakeCameras([broken]))
+
+    with pytest.raises(ValidationError):
+        cameras.list_cameras("u1")
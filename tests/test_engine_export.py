@@ -0,0 +1,40 @@
+from pathlib import Path
+
+from app.object_detection_part import object_detection
+
+
+class FakeYOLO:
+    """Writes ``<weights>.engine`` on export, as Ultralytics does."""
+
+    def __init__(self, weights):
+        self.weights = Path(weights)
+
+    def export(self, **kwargs):
+        engine = self.weights.with_suffix(".engine")
+        engine.write_text("int8" if kwargs.get("int8") else "fp16")
+        return str(engine)
+
+
+def test_int8_export_keeps_the_fp16_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(object_detection, "YOLO", FakeYOLO)
+    weights = tmp_path / "model.pt"
+    weights.write_text("weights")
+    fp16 = tmp_path / "model.engine"
+    fp16.write_text("fp16")
+    int8 = tmp_path / "model_int8.engine"
+
+    object_detection._export_engine(str(weights), int8, int8=True)
+
+    assert int8.read_text() == "int8"
+    assert fp16.read_text() == "fp16"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["model.engine", "model.pt", "model_int8.engine"]
+
+
+def test_export_to_the_default_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(object_detection, "YOLO", FakeYOLO)
+    weights = tmp_path / "model.pt"
+    weights.write_text("weights")
+
+    engine = object_detection._export_engine(str(weights), tmp_path / "model.engine", half=True)
+
+    assert engine.read_text() == "fp16"
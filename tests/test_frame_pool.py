@@ -0,0 +1,69 @@
+from fractions import Fraction
+
+import numpy as np
+from av import VideoFrame
+
+from app.rule_engine import engine
+from app.rule_engine.engine import AgentRuntime, hold_frame, release_frame
+
+
+def _runtime():
+    return AgentRuntime(agent_id="a", camera_id="pool-cam", model=None, rules=[], fps=5)
+
+
+def _camera_frame(pts=1):
+    pixels = np.random.default_rng(pts).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    frame = VideoFrame.from_ndarray(pixels, format="bgr24")
+    frame.pts = pts
+    frame.time_base = Fraction(1, 90000)
+    return frame
+
+
+def test_frames_are_reused_once_the_pool_is_full():
+    runtime = _runtime()
+    first = [engine._pooled_frame(runtime, 64, 48) for _ in range(engine._FRAME_POOL_SIZE)]
+
+    assert engine._pooled_frame(runtime, 64, 48) is first[0]
+
+
+def test_held_and_newest_frames_are_not_reused():
+    runtime = _runtime()
+    first = [engine._pooled_frame(runtime, 64, 48) for _ in range(engine._FRAME_POOL_SIZE)]
+    for frame in first[:-1]:
+        hold_frame(frame)
+    try:
+        fresh = engine._pooled_frame(runtime, 64, 48)
+        assert all(fresh is not frame for frame in first)
+
+        release_frame(first[1])
+        assert engine._pooled_frame(runtime, 64, 48) is first[1]
+    finally:
+        for frame in first:
+            release_frame(frame)
+
+    assert len(runtime.frame_pools["bgr24"]) == engine._FRAME_POOL_SIZE
+
+
+def test_own_copy_matches_the_camera_frame():
+    runtime = _runtime()
+    frame = _camera_frame()
+
+    out = engine._own_copy(runtime, frame)
+
+    assert out is not frame
+    assert out.pts == frame.pts
+    np.testing.assert_array_equal(out.to_ndarray(), frame.to_ndarray())
+
+
+def test_own_copy_fallback_takes_one_pooled_frame(monkeypatch):
+    monkeypatch.setattr(engine, "_fits_pool", lambda frame: False)
+    runtime = _runtime()
+    bgr = _camera_frame()
+    yuv = bgr.reformat(format="yuv420p")
+
+    out = engine._own_copy(runtime, bgr)
+    np.testing.assert_array_equal(out.to_ndarray(), bgr.to_ndarray())
+    engine._own_copy(runtime, yuv)
+
+    assert list(runtime.frame_pools) == ["bgr24"]
+    assert len(runtime.frame_pools["bgr24"]) == 2
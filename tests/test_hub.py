@@ -0,0 +1,70 @@
+import asyncio
+
+from app.shared_hub.hub import CameraChannel, SharedFrameHub, Subscriber
+
+
+def test_subscriber_drops_oldest_frame_when_full():
+    sub = Subscriber(maxlen=2)
+    for frame in ("f1", "f2", "f3"):
+        sub.put_nowait(frame)
+
+    assert sub.qsize() == 2
+    assert sub.get_nowait() == "f2"
+    assert sub.get_nowait() == "f3"
+    assert sub.empty()
+
+
+def test_subscriber_get_waits_for_the_next_frame():
+    async def scenario():
+        sub = Subscriber(maxlen=1)
+        waiter = asyncio.create_task(sub.get())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        sub.put_nowait("f1")
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(scenario()) == "f1"
+
+
+def test_new_subscriber_gets_the_latest_frame():
+    channel = CameraChannel("cam")
+    channel.publish("f1")
+    channel.publish("f2")
+
+    sub = channel.subscribe()
+
+    assert sub.get_nowait() == "f2"
+    assert sub.empty()
+
+
+def test_unsubscribed_subscriber_gets_nothing():
+    channel = CameraChannel("cam")
+    sub = channel.subscribe()
+    channel.unsubscribe(sub)
+    channel.publish("f1")
+
+    assert sub.empty()
+    assert not channel.has_subscribers()
+
+
+def test_close_channel_drops_last_frame_but_keeps_subscribers():
+    hub = SharedFrameHub()
+    sub = hub.subscribe("cam")
+    hub.publish("cam", "f1")
+    sub.get_nowait()
+
+    hub.close_channel("cam")
+
+    assert hub.get_latest("cam") is None
+    hub.publish("cam", "f2")
+    assert sub.get_nowait() == "f2"
+
+
+def test_close_channel_without_subscribers_forgets_it():
+    hub = SharedFrameHub()
+    hub.publish("cam", "f1")
+
+    hub.close_channel("cam")
+
+    assert not hub.has_subscribers("cam")
+    assert hub.subscribe("cam").empty()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from app.object_detection_part import _kp_numba
+from app.object_detection_part._kp_numba import build_draw_lists, stamp_keypoints
+
+SKELETON = np.array([[0, 1], [1, 2]], dtype=np.int32)
+
+
+def _person(points, conf):
+    kpts = np.array([points], dtype=np.float32)
+    confs = np.full((1, len(points)), conf, dtype=np.float32)
+    return kpts, confs
+
+
+def test_edges_need_both_ends_visible():
+    kpts, confs = _person([[10, 10], [20, 20], [0, 0]], 0.9)
+    edges, centers = build_draw_lists(kpts, confs, SKELETON, 0.3)
+
+    assert edges.tolist() == [[[10, 10], [20, 20]]]
+    assert centers.tolist() == [[10, 10], [20, 20]]
+
+
+def test_person_without_confident_keypoint_is_skipped():
+    kpts, confs = _person([[10, 10], [20, 20], [30, 30]], 0.1)
+    edges, centers = build_draw_lists(kpts, confs, SKELETON, 0.3)
+
+    assert len(edges) == 0
+    assert len(centers) == 0
+
+
+def test_compiled_and_numpy_versions_agree():
+    rng = np.random.default_rng(0)
+    kpts = rng.uniform(-5, 100, size=(4, 17, 2)).astype(np.float32)
+    confs = rng.uniform(0, 1, size=(4, 17)).astype(np.float32)
+    skel = rng.integers(0, 17, size=(19, 2)).astype(np.int32)
+
+    compiled = build_draw_lists(kpts, confs, skel, 0.3)
+    reference = _kp_numba._build_draw_lists_np(kpts, confs, skel, 0.3)
+
+    for got, expected in zip(compiled, reference):
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_stamp_clips_at_the_image_border():
+    img = np.zeros((4, 4, 3), dtype=np.uint8)
+    centers = np.array([[0, 0]], dtype=np.int32)
+    offsets = np.array([[-1, 0], [0, 0], [1, 0]], dtype=np.int32)
+    colors = np.full((3, 3), 255, dtype=np.uint8)
+
+    stamp_keypoints(img, centers, offsets, colors)
+
+    assert img[0, 0].tolist() == [255, 255, 255]
+    assert img[0, 1].tolist() == [255, 255, 255]
+    assert img.sum() == 255 * 6
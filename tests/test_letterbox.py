@@ -0,0 +1,53 @@
+import numpy as np
+from av import VideoFrame
+
+from app.object_detection_part.object_detection import (
+    LETTERBOX_FILL,
+    letterbox,
+    letterbox_frame,
+    unletterbox_detections,
+)
+
+
+def test_letterbox_keeps_aspect_ratio_and_centers_the_image():
+    bgr = np.full((480, 640, 3), 200, dtype=np.uint8)
+    img, ratio, pad = letterbox(bgr, 320)
+
+    assert img.shape == (320, 320, 3)
+    assert ratio == 0.5
+    assert pad == (0, 40)
+    assert (img[:40] == LETTERBOX_FILL).all()
+    assert (img[280:] == LETTERBOX_FILL).all()
+    assert (img[40:280] == 200).all()
+
+
+def test_letterbox_reuses_out_buffer():
+    out = np.zeros((320, 320, 3), dtype=np.uint8)
+    img, _, _ = letterbox(np.zeros((100, 100, 3), dtype=np.uint8), 320, out=out)
+    assert img is out
+
+
+def test_letterbox_frame_matches_letterbox_geometry():
+    bgr = np.zeros((360, 640, 3), dtype=np.uint8)
+    frame = VideoFrame.from_ndarray(bgr, format="bgr24")
+
+    img, ratio, pad = letterbox_frame(frame, 640)
+    expected_img, expected_ratio, expected_pad = letterbox(bgr, 640)
+
+    assert img.shape == expected_img.shape
+    assert ratio == expected_ratio
+    assert pad == expected_pad
+
+
+def test_unletterbox_maps_boxes_back_to_frame_coordinates():
+    dets = [{"bbox": [10, 50, 110, 150]}]
+    out = unletterbox_detections(dets, 0.5, (10, 40), (480, 640))
+
+    assert out is dets  # in place
+    assert dets[0]["bbox"] == [0, 20, 200, 220]
+
+
+def test_unletterbox_clips_boxes_to_the_frame():
+    dets = [{"bbox": [0, 0, 400, 400]}]
+    unletterbox_detections(dets, 0.5, (0, 40), (480, 640))
+    assert dets[0]["bbox"] == [0, 0, 639, 479]
@@ -0,0 +1,17 @@
+from pathlib import Path
+
+from app.object_detection_part.load_model import _engine_path
+
+
+def test_engine_name_follows_batch_and_image_size():
+    weights = Path("models/yolov8n.pt")
+
+    assert _engine_path(weights, 8, 640) == Path("models/yolov8n_b8_640.engine")
+    assert _engine_path(weights, 8, 640, int8=True) == Path("models/yolov8n_b8_640_int8.engine")
+
+
+def test_changed_batch_does_not_reuse_the_old_engine():
+    weights = Path("yolov8n.pt")
+
+    assert _engine_path(weights, 16, 640) != _engine_path(weights, 8, 640)
+    assert _engine_path(weights, 8, 320) != _engine_path(weights, 8, 640)
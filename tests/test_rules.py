@@ -0,0 +1,55 @@
+from app.models import AgentRule
+from app.rule_engine.engine import AgentRuntime, compile_rule_plan, run_rules_for_agent
+
+
+def _rule(rule_type, target, min_count=None):
+    return AgentRule.model_validate({"type": rule_type, "class": target, "label": target, "min_count": min_count})
+
+
+def _runtime(rules):
+    return AgentRuntime(agent_id="a", camera_id="c", model=None, rules=rules, fps=5)
+
+
+DETECTIONS = [
+    {"class_name": "person", "bbox": [0, 0, 1, 1]},
+    {"class_name": "car", "bbox": [0, 0, 1, 1]},
+    {"class_name": "person", "bbox": [1, 1, 2, 2]},
+]
+
+
+def test_class_presence_keeps_only_the_target_class():
+    matched, kept = run_rules_for_agent(_runtime([_rule("class_presence", "person")]), DETECTIONS)
+
+    assert matched
+    assert kept == [DETECTIONS[0], DETECTIONS[2]]
+
+
+def test_class_count_needs_min_count():
+    runtime = _runtime([_rule("class_count", "person", min_count=3)])
+    matched, kept = run_rules_for_agent(runtime, DETECTIONS)
+
+    assert not matched
+    assert kept == []
+
+
+def test_no_detection_of_the_class_is_no_match():
+    matched, kept = run_rules_for_agent(_runtime([_rule("class_presence", "dog")]), DETECTIONS)
+    assert (matched, kept) == (False, [])
+
+
+def test_unknown_rule_types_are_dropped_from_the_plan():
+    plan = compile_rule_plan([_rule("no_such_rule", "person"), _rule("class_presence", "person")])
+
+    assert list(plan) == ["person"]
+    assert [rule.type for rule, _handler in plan["person"]] == ["class_presence"]
+
+
+def test_plan_of_only_unknown_rules_is_compiled_once(caplog):
+    runtime = _runtime([_rule("no_such_rule", "person")])
+    assert runtime.rule_plan == {}
+    caplog.clear()
+
+    for _ in range(3):
+        assert run_rules_for_agent(runtime, DETECTIONS) == (False, [])
+
+    assert "Unknown rule type" not in caplog.text
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.agent_scheduler import _next_transition_delay, _run_agent
+from app.rule_engine import engine
+from app.rule_engine.engine import AgentRuntime
+
+
+class FakeAgents:
+    """Answers the two find_one() calls of _next_transition_delay."""
+
+    def __init__(self, next_start=None, next_end=None):
+        self.next_start = next_start
+        self.next_end = next_end
+
+    async def find_one(self, query, projection=None, sort=None):
+        if "start_at" in query:
+            return {"start_at": self.next_start} if self.next_start else None
+        return {"end_at": self.next_end} if self.next_end else None
+
+
+def test_no_upcoming_transition():
+    now = datetime.now(timezone.utc)
+    assert asyncio.run(_next_transition_delay(FakeAgents(), now)) is None
+
+
+def test_sleeps_until_the_earliest_start_or_end():
+    now = datetime.now(timezone.utc)
+    coll = FakeAgents(next_start=now + timedelta(seconds=60), next_end=now + timedelta(seconds=30))
+
+    delay = asyncio.run(_next_transition_delay(coll, now))
+
+    assert 25 < delay <= 30
+
+
+def test_transition_already_due_is_zero():
+    now = datetime.now(timezone.utc)
+    coll = FakeAgents(next_end=now - timedelta(seconds=5))
+
+    assert asyncio.run(_next_transition_delay(coll, now)) == 0.0
+
+
+def test_camera_caches_are_dropped_with_its_last_runner():
+    def cached():
+        return (
+            "idle-cam" in engine._shared_bgr,
+            "idle-cam" in engine._shared_letterbox,
+            ("idle-cam", 1) in engine._shared_detections,
+        )
+
+    async def scenario():
+        engine._shared_bgr["idle-cam"] = engine._shared_letterbox["idle-cam"] = (None, None)
+        engine._shared_detections[("idle-cam", 1)] = (None, None)
+        runtimes = [
+            AgentRuntime(agent_id=agent_id, camera_id="idle-cam", model=None, rules=[], fps=100)
+            for agent_id in ("a", "b")
+        ]
+        runners = [asyncio.ensure_future(_run_agent(runtime)) for runtime in runtimes]
+        await asyncio.sleep(0.05)
+
+        runners[0].cancel()
+        await asyncio.wait({runners[0]})
+        still_cached = cached()
+
+        runners[1].cancel()
+        await asyncio.wait({runners[1]})
+        return still_cached, cached()
+
+    still_cached, after = asyncio.run(scenario())
+
+    assert still_cached == (True, True, True)
+    assert after == (False, False, False)
@@ -0,0 +1,133 @@
+import asyncio
+
+import msgpack
+
+from app.signaling_server import signaling_server as sig
+
+
+class FakeWebSocket:
+    """Records what the server sends; ``fail`` makes every send raise."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.sent = []
+        self.closed_with = None
+        self.fail = fail
+
+    async def send_text(self, data):
+        if self.fail:
+            raise ConnectionError("gone")
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        if self.fail:
+            raise ConnectionError("gone")
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+async def _drain():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_decode_message_reads_json_text_and_msgpack_bytes():
+    msg = {"type": "ice", "to": "viewer:u:c"}
+    assert sig.decode_message(sig.json_dumps(msg)) == msg
+    assert sig.decode_message(msgpack.packb(msg)) == msg
+
+
+def test_redis_frames_keep_text_and_binary_apart():
+    assert sig.unpack_frame(sig.pack_frame("text")) == "text"
+    assert sig.unpack_frame(sig.pack_frame(b"\x01bin")) == b"\x01bin"
+
+
+def test_publisher_id_for_viewer():
+    assert sig.get_publisher_id_for_viewer("viewer:u:cam") == "camera:u:cam"
+    assert sig.get_publisher_id_for_viewer("viewer:u:cam:ag") == "agent:u:cam:ag"
+    assert sig.get_publisher_id_for_viewer("viewer:u") is None
+
+
+def test_relay_forwards_the_original_frame_in_the_same_codec():
+    async def scenario():
+        ws = FakeWebSocket()
+        target = sig.Client("viewer:u:c", ws)
+        raw = '{"type":"answer","to":"viewer:u:c"}'
+        sig.relay(target, raw, sig.decode_message(raw))
+        await _drain()
+        target.stop()
+        return ws.sent
+
+    assert asyncio.run(scenario()) == ['{"type":"answer","to":"viewer:u:c"}']
+
+
+def test_relay_reencodes_for_a_binary_client():
+    async def scenario():
+        ws = FakeWebSocket()
+        target = sig.Client("camera:u:c", ws, binary=True)
+        msg = {"type": "answer", "to": "camera:u:c"}
+        sig.relay(target, sig.json_dumps(msg), msg)
+        await _drain()
+        target.stop()
+        return ws.sent
+
+    (frame,) = asyncio.run(scenario())
+    assert msgpack.unpackb(frame) == {"type": "answer", "to": "camera:u:c"}
+
+
+def test_ice_candidates_of_a_burst_go_out_as_one_batch():
+    async def scenario():
+        ws = FakeWebSocket()
+        target = sig.Client("viewer:u:c", ws, ice_batch=True)
+        for n in range(3):
+            target.queue_ice({"type": "ice", "candidate": {"candidate": f"c{n}"}})
+        await asyncio.sleep(sig.ICE_BATCH_WINDOW_SEC * 4)
+        target.stop()
+        return ws.sent
+
+    (frame,) = asyncio.run(scenario())
+    batch = sig.decode_message(frame)
+    assert batch["type"] == "ice-batch"
+    assert [c["candidate"]["candidate"] for c in batch["candidates"]] == ["c0", "c1", "c2"]
+
+
+def test_failed_writer_closes_the_client():
+    async def scenario():
+        ws = FakeWebSocket(fail=True)
+        client = sig.Client("viewer:u:c", ws)
+        client.send("{}")
+        await _drain()
+        client.stop()
+        return ws.closed_with
+
+    assert asyncio.run(scenario()) == 1011
+
+
+class BrokenRedis:
+    """Redis client whose pub/sub connection drops as soon as it is used."""
+
+    def pubsub(self):
+        return self
+
+    async def subscribe(self, channel):
+        raise ConnectionError("redis went away")
+
+    async def unsubscribe(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+def test_failed_redis_reader_closes_the_client(monkeypatch):
+    monkeypatch.setattr(sig, "redis_client", BrokenRedis())
+
+    async def scenario():
+        ws = FakeWebSocket()
+        client = sig.Client("viewer:u:c", ws)
+        await _drain()
+        client.stop()
+        return ws.closed_with
+
+    assert asyncio.run(scenario()) == 1011